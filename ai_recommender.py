@@ -1,183 +1,619 @@
-import torch
-import torch.nn as nn
-from transformers import AutoTokenizer, AutoModel, pipeline
-from sentence_transformers import SentenceTransformer
+import importlib
+import os
+import sys
+import threading
+import time
 import numpy as np
-from sklearn.metrics.pairwise import cosine_similarity
 import json
 from pathlib import Path
 import logging
 
+from embedding_cache import EmbeddingCache
+import artifact_bundle
+import autotune
+import inference_backends
+import instrumentation
+from text_budget import TextBudget
+from embedding_format import check_embedding_format, encode_embedding
+
+# Sentence transformer used for all embeddings, and its output size
+EMBEDDING_MODEL = 'all-MiniLM-L6-v2'
+EMBEDDING_DIM = 384
+
+# Emotion classifier, sentiment pipeline and attention-keyword models
+EMOTION_MODEL = 'j-hartmann/emotion-english-distilroberta-base'
+SENTIMENT_MODEL = 'distilbert/distilbert-base-uncased-finetuned-sst-2-english'
+KEYWORD_MODEL = 'bert-base-uncased'
+
+# Models that can be loaded on demand, keyed by the names accepted by warmup()
+MODEL_NAMES = ('emotion', 'sentiment', 'embedding', 'keywords')
+
+# Descriptions embedded once to represent each mood
+MOOD_DESCRIPTIONS = {
+    'happy': 'feeling joyful, excited, and positive about life',
+    'sad': 'feeling down, melancholic, and emotionally heavy',
+    'relaxed': 'feeling calm, peaceful, and at ease',
+    'energetic': 'feeling dynamic, motivated, and full of energy',
+    'focused': 'feeling concentrated, productive, and mentally sharp',
+    'angry': 'feeling frustrated, irritated, and emotionally charged',
+    'anxious': 'feeling worried, nervous, and unsettled',
+    'bored': 'feeling uninterested, unstimulated, and seeking engagement',
+    'nostalgic': 'feeling reminiscent of past experiences and memories',
+    'romantic': 'feeling love, affection, and emotional connection'
+}
+
+# Content type embeddings for better matching
+CONTENT_TYPE_DESCRIPTIONS = {
+    'video': 'engaging visual content for entertainment and learning',
+    'music': 'audio tracks and songs for emotional expression',
+    'podcast': 'audio discussions and storytelling content'
+}
+
+
+class ModelUnavailableError(RuntimeError):
+    """Raised when a model is needed but could not be loaded"""
+
+
+def normalize_rows(matrix):
+    """Return a contiguous float32 copy of matrix with unit-length rows (zero rows stay zero)"""
+    matrix = np.atleast_2d(np.asarray(matrix, dtype=np.float32))
+    norms = np.linalg.norm(matrix, axis=1, keepdims=True)
+    return np.ascontiguousarray(np.divide(matrix, norms, out=np.zeros_like(matrix), where=norms > 0))
+
 class AIRecommender:
     """
     Advanced AI-powered content recommendation system using transformer models
     for better mood detection and content matching.
+    Heavy libraries are imported and each model is loaded the first time it is
+    used; call warmup() to pay that cost up front.
     """
     
-    def __init__(self):
-        # Initialize models and tokenizers
-        try:
-            # Load BERT model for mood classification
-            self.tokenizer = AutoTokenizer.from_pretrained('bert-base-uncased')
-            self.model = AutoModel.from_pretrained('bert-base-uncased')
-            
-            # Load sentiment analysis pipeline
-            self.sentiment_analyzer = pipeline('sentiment-analysis')
-            
-            # Load sentence transformer for semantic similarity
-            self.sentence_transformer = SentenceTransformer('all-MiniLM-L6-v2')
-            
-            # Initialize emotion classifier
-            self.emotion_classifier = pipeline('text-classification', 
-                                            model='j-hartmann/emotion-english-distilroberta-base')
-            
-            logging.info("AI models loaded successfully")
-            self.models_loaded = True
-            
-        except Exception as e:
-            logging.error(f"Error loading AI models: {e}")
-            self.models_loaded = False
+    def __init__(self, embedding_cache_dir=None, embedding_cache_size=4096,
+                 embedding_cache_read_only=False, attention_keywords=False, backend='torch',
+                 content_index=None, metrics=None, text_budget=None, tuning=None, bundle=None):
+        """
+        embedding_cache_dir: optional directory for a persistent, memory-mapped
+        embedding store shared by worker processes
+        embedding_cache_read_only: look embeddings up in the store without writing to it
+        attention_keywords: extract mood_context['keywords'] from BERT attention
+        (loads an extra model; off by default)
+        backend: 'torch' (fp32), 'quantized' (int8 dynamic) or 'onnx' (ONNX Runtime)
+        for the emotion, sentiment and embedding models
+        content_index: optional content_index.ContentIndex of catalog items; when set,
+        get_content_recommendations also returns the top matching items
+        metrics: instrumentation.MetricsRegistry for stage timings and cache
+        hit rates (the process-wide registry by default)
+        text_budget: text_budget.TextBudget deciding per-model token budgets,
+        truncation strategy and length-bucketed batch sizes
+        tuning: autotune settings (torch_threads, interop_threads, batch_size);
+        by default read from $MOODSYNC_TUNING_CONFIG or the autotune cache file
+        bundle: artifact_bundle.ArtifactBundle or path to one; its mood and
+        content-type embeddings are used instead of encoding the descriptions
+        when they were built with the same model. Defaults to $MOODSYNC_BUNDLE
+        or the default bundle when one exists; pass False to always encode.
+        """
+        self.attention_keywords = attention_keywords
+        self.backend = inference_backends.check_backend(backend)
+        self.content_index = content_index
+        
+        # Per-host thread and batch settings; threads must be set before torch spins up its pools
+        self.tuning = tuning if tuning is not None else autotune.load_tuning()
+        autotune.apply_thread_settings(self.tuning)
+        batch_size = (self.tuning or {}).get('batch_size') or 16
+        self.text_budget = text_budget if text_budget is not None else TextBudget(batch_size=batch_size)
+        self.mood_names = list(MOOD_DESCRIPTIONS)
+        self.content_type_names = list(CONTENT_TYPE_DESCRIPTIONS)
+        
+        # Loaded models by name; a None entry marks a model that failed to load
+        self._models = {}
+        self._load_lock = threading.RLock()
+        self._reference = None
+        self.startup_times = {}
+        
+        # In-process LRU plus optional on-disk store in front of the encoder;
+        # non-fp32 backends get their own store since their vectors differ slightly
+        store_name = EMBEDDING_MODEL if self.backend == 'torch' else f'{EMBEDDING_MODEL}-{self.backend}'
+        self.embedding_model_name = store_name
+        self.embedding_cache = EmbeddingCache(
+            self._encode_texts, store_name, EMBEDDING_DIM,
+            maxsize=embedding_cache_size,
+            directory=embedding_cache_dir,
+            read_only=embedding_cache_read_only
+        )
         
-        # Load mood embeddings
-        self.mood_embeddings = self._initialize_mood_embeddings()
+        self.metrics = metrics if metrics is not None else instrumentation.REGISTRY
+        self.metrics.register_cache('transformer.embedding', self.embedding_cache)
         
-        # Content type embeddings for better matching
-        self.content_type_embeddings = {
-            'video': self._get_embedding('engaging visual content for entertainment and learning'),
-            'music': self._get_embedding('audio tracks and songs for emotional expression'),
-            'podcast': self._get_embedding('audio discussions and storytelling content')
+        if bundle is None or isinstance(bundle, (str, os.PathLike)):
+            bundle = artifact_bundle.ArtifactBundle.open(bundle)
+        self.bundle = bundle or None
+        self._bundle_version = self.bundle.version if self.bundle is not None else None
+    
+    @property
+    def models_loaded(self):
+        """False once any model has failed to load; models not yet used count as available"""
+        return all(model is not None for model in self._models.values())
+    
+    def _record_time(self, stage, start):
+        self.startup_times[stage] = self.startup_times.get(stage, 0.0) + time.perf_counter() - start
+    
+    def _import(self, module_name):
+        """Import a heavy dependency on first use and record how long it took"""
+        if module_name in sys.modules:
+            return sys.modules[module_name]
+        start = time.perf_counter()
+        module = importlib.import_module(module_name)
+        self._record_time(f'import_{module_name}', start)
+        return module
+    
+    def _load_model(self, name):
+        """Load one model on first use; raises ModelUnavailableError if it cannot be loaded"""
+        with self._load_lock:
+            if name not in self._models:
+                start = time.perf_counter()
+                try:
+                    self._models[name] = getattr(self, f'_create_{name}_model')()
+                    logging.info(f"AI model '{name}' loaded")
+                    # torch is imported by now, so thread settings can be applied directly
+                    autotune.apply_thread_settings(self.tuning)
+                except Exception as e:
+                    logging.error(f"Error loading AI model '{name}': {e}")
+                    self._models[name] = None
+                self._record_time(f'load_{name}', start)
+            model = self._models[name]
+        if model is None:
+            raise ModelUnavailableError(f"AI model '{name}' is not available")
+        return model
+    
+    def _model_failed(self, name):
+        """True if loading the named model was attempted and failed"""
+        return name in self._models and self._models[name] is None
+    
+    def _create_emotion_model(self):
+        self._import('transformers')
+        return inference_backends.create_pipeline('text-classification', EMOTION_MODEL, self.backend)
+    
+    def _create_sentiment_model(self):
+        self._import('transformers')
+        return inference_backends.create_pipeline('sentiment-analysis', SENTIMENT_MODEL, self.backend)
+    
+    def _create_embedding_model(self):
+        self._import('sentence_transformers')
+        return inference_backends.create_sentence_transformer(EMBEDDING_MODEL, self.backend)
+    
+    def _create_keywords_model(self):
+        # BERT for attention-based keywords; attentions must be returned to be useful
+        transformers = self._import('transformers')
+        tokenizer = transformers.AutoTokenizer.from_pretrained(KEYWORD_MODEL)
+        model = transformers.AutoModel.from_pretrained(KEYWORD_MODEL, output_attentions=True)
+        return (tokenizer, model)
+    
+    @property
+    def emotion_classifier(self):
+        return self._load_model('emotion')
+    
+    @property
+    def sentiment_analyzer(self):
+        return self._load_model('sentiment')
+    
+    @property
+    def sentence_transformer(self):
+        return self._load_model('embedding')
+    
+    @property
+    def tokenizer(self):
+        return self._load_model('keywords')[0]
+    
+    @property
+    def model(self):
+        return self._load_model('keywords')[1]
+    
+    def warmup(self, models=('emotion', 'sentiment', 'embedding')):
+        """
+        Load the given models and run one dummy inference through each so the
+        first real request does not pay for imports, weight loading or lazy init.
+        Returns the startup report.
+        """
+        sample = 'warming up the mood models'
+        for name in models:
+            if name not in MODEL_NAMES:
+                raise ValueError(f"Unknown model '{name}', expected one of {MODEL_NAMES}")
+            try:
+                self._load_model(name)
+                if name == 'embedding':
+                    self._reference_embeddings()
+                start = time.perf_counter()
+                if name == 'emotion':
+                    self.emotion_classifier(sample)
+                elif name == 'sentiment':
+                    self.sentiment_analyzer(sample)
+                elif name == 'embedding':
+                    self._encode_texts([sample])
+                else:
+                    self.model(**self.tokenizer(sample, return_tensors='pt'))
+                self._record_time(f'warmup_{name}', start)
+            except Exception as e:
+                logging.error(f"Error warming up AI model '{name}': {e}")
+        return self.startup_report()
+    
+    def startup_report(self):
+        """
+        Seconds spent per startup stage (imports, model loads, reference
+        embeddings, warm-up inference) plus which models are loaded.
+        """
+        with self._load_lock:
+            loaded = {name: name in self._models and self._models[name] is not None
+                      for name in MODEL_NAMES}
+        return {
+            'stages': dict(self.startup_times),
+            'total_seconds': sum(self.startup_times.values()),
+            'loaded': loaded
         }
+    
+    def _reference_embeddings(self):
+        """Embed the mood and content-type descriptions once, on first use (or map them from the bundle)"""
+        if self._reference is not None:
+            return self._reference
+        with self._load_lock:
+            if self._reference is None:
+                self._reference = self._bundled_reference()
+            if self._reference is None:
+                start = time.perf_counter()
+                mood_embeddings = self._initialize_mood_embeddings()
+                content_type_embeddings = {
+                    name: self._get_embedding(description)
+                    for name, description in CONTENT_TYPE_DESCRIPTIONS.items()
+                }
+                self._reference = {
+                    'mood_embeddings': mood_embeddings,
+                    'content_type_embeddings': content_type_embeddings,
+                    # Pre-normalized matrices so scoring against all moods/types is one matmul
+                    'mood_matrix': normalize_rows([mood_embeddings[mood] for mood in self.mood_names]),
+                    'content_type_matrix': normalize_rows(
+                        [content_type_embeddings[name] for name in self.content_type_names])
+                }
+                self._record_time('reference_embeddings', start)
+                
+                # Persist the static embeddings so other workers start without encoding them
+                self.flush_embedding_cache()
+        return self._reference
+    
+    def _bundled_reference(self):
+        """Reference embeddings memory-mapped from the bundle, if it has ones matching this model"""
+        if self.bundle is None or self.bundle.array('mood_matrix') is None:
+            return None
+        metadata = self.bundle.metadata
+        digest = artifact_bundle.descriptions_digest(MOOD_DESCRIPTIONS, CONTENT_TYPE_DESCRIPTIONS)
+        if (metadata.get('embedding_model') != self.embedding_model_name
+                or metadata.get('descriptions_digest') != digest
+                or metadata.get('mood_names') != self.mood_names
+                or metadata.get('content_type_names') != self.content_type_names):
+            logging.warning(f"Artifact bundle {self.bundle.version} embeddings do not match "
+                            f"{self.embedding_model_name}; encoding the descriptions instead")
+            return None
+        mood_embeddings = self.bundle.array('mood_embeddings')
+        content_type_embeddings = self.bundle.array('content_type_embeddings')
+        return {
+            'mood_embeddings': dict(zip(self.mood_names, mood_embeddings)),
+            'content_type_embeddings': dict(zip(self.content_type_names, content_type_embeddings)),
+            'mood_matrix': self.bundle.array('mood_matrix'),
+            'content_type_matrix': self.bundle.array('content_type_matrix')
+        }
+    
+    def reload_bundle(self):
+        """
+        Switch to a new artifact bundle if one replaced the file since it was
+        opened. Returns True when the reference embeddings will be re-read.
+        """
+        if self.bundle is None:
+            return False
+        self.bundle.reload()
+        with self._load_lock:
+            if self.bundle.version == self._bundle_version:
+                return False
+            self._bundle_version = self.bundle.version
+            self._reference = None
+        return True
+    
+    @property
+    def mood_embeddings(self):
+        return self._reference_embeddings()['mood_embeddings']
+    
+    @property
+    def content_type_embeddings(self):
+        return self._reference_embeddings()['content_type_embeddings']
+    
+    @property
+    def mood_matrix(self):
+        return self._reference_embeddings()['mood_matrix']
+    
+    @property
+    def content_type_matrix(self):
+        return self._reference_embeddings()['content_type_matrix']
         
     def _initialize_mood_embeddings(self):
         """Initialize pre-computed embeddings for different moods"""
-        mood_descriptions = {
-            'happy': 'feeling joyful, excited, and positive about life',
-            'sad': 'feeling down, melancholic, and emotionally heavy',
-            'relaxed': 'feeling calm, peaceful, and at ease',
-            'energetic': 'feeling dynamic, motivated, and full of energy',
-            'focused': 'feeling concentrated, productive, and mentally sharp',
-            'angry': 'feeling frustrated, irritated, and emotionally charged',
-            'anxious': 'feeling worried, nervous, and unsettled',
-            'bored': 'feeling uninterested, unstimulated, and seeking engagement',
-            'nostalgic': 'feeling reminiscent of past experiences and memories',
-            'romantic': 'feeling love, affection, and emotional connection'
-        }
-        
-        return {mood: self._get_embedding(desc) for mood, desc in mood_descriptions.items()}
+        return {mood: self._get_embedding(desc) for mood, desc in MOOD_DESCRIPTIONS.items()}
     
     def _get_embedding(self, text):
-        """Get embedding for a piece of text using sentence transformer"""
-        if not self.models_loaded:
-            return np.zeros(384)  # Default embedding size for all-MiniLM-L6-v2
-        return self.sentence_transformer.encode(text)
+        """
+        Get embedding for a piece of text using sentence transformer.
+        Cached embeddings are served without loading the encoder; otherwise
+        raises ModelUnavailableError if the encoder cannot be loaded.
+        """
+        return self.embedding_cache.get(text)
+    
+    def _get_embeddings(self, texts):
+        """Get embeddings for a list of texts in one encoder call (raises like _get_embedding)"""
+        return np.stack(self.embedding_cache.get_many(list(texts)))
+    
+    def _encode_texts(self, texts):
+        """
+        Run the sentence transformer on texts that missed the embedding cache.
+        Inputs are fitted to the embedding budget; encode() already sorts its
+        batches by length, so no extra bucketing is needed here.
+        """
+        return self.sentence_transformer.encode([self.text_budget.prepare(text, 'embedding') for text in texts])
+    
+    def flush_embedding_cache(self):
+        """Write newly computed embeddings to the persistent store, if one is configured"""
+        try:
+            return self.embedding_cache.flush()
+        except OSError as e:
+            logging.error(f"Error writing embedding cache: {e}")
+            return 0
     
-    def analyze_mood(self, text):
+    def analyze_mood(self, text, trace=None):
         """
         Advanced mood analysis using multiple AI models.
         Returns tuple of (mood_category, confidence_score, mood_context)
+        An instrumentation.Trace passed as trace receives per-stage timings.
         """
         if not text or not self.models_loaded:
+            if not self.models_loaded:
+                self.metrics.increment('transformer.unavailable')
             return ('neutral', 0.5, {})
             
         try:
-            # Get emotion classification
-            emotions = self.emotion_classifier(text)
-            emotion_label = emotions[0]['label']
-            emotion_score = emotions[0]['score']
-            
-            # Get sentiment analysis
-            sentiment = self.sentiment_analyzer(text)[0]
-            sentiment_label = sentiment['label']
-            sentiment_score = sentiment['score']
-            
-            # Get text embedding
-            text_embedding = self._get_embedding(text)
-            
-            # Calculate similarity with each mood
-            mood_similarities = {
-                mood: cosine_similarity(
-                    [text_embedding], 
-                    [embedding]
-                )[0][0] for mood, embedding in self.mood_embeddings.items()
-            }
-            
-            # Get the best matching mood
-            best_mood = max(mood_similarities.items(), key=lambda x: x[1])
-            mood_category = best_mood[0]
-            confidence = best_mood[1]
-            
-            # Create mood context with additional information
-            mood_context = {
-                'emotion': emotion_label,
-                'emotion_confidence': emotion_score,
-                'sentiment': sentiment_label,
-                'sentiment_confidence': sentiment_score,
-                'intensity': self._calculate_intensity(text),
-                'temporal': self._detect_temporal_context(text),
-                'keywords': self._extract_relevant_keywords(text)
-            }
-            
-            return (mood_category, confidence, mood_context)
+            with self.metrics.timer('transformer.analyze', trace):
+                # Run each model once; every derived field below reuses these outputs
+                inference = self._run_inference(text, trace)
+                return self._build_mood_result(text, inference, trace)
             
+        except ModelUnavailableError:
+            # A model failed on first use, after the models_loaded check above
+            self.metrics.increment('transformer.unavailable')
+            return ('neutral', 0.5, {})
         except Exception as e:
             logging.error(f"Error in mood analysis: {e}")
+            self.metrics.increment('transformer.errors')
             return ('neutral', 0.5, {})
     
-    def get_content_recommendations(self, text, mood_category, mood_context):
+    def analyze_moods(self, texts):
+        """
+        Batch mood analysis: each model runs once over all non-empty texts.
+        Returns a list of (mood_category, confidence_score, mood_context) in input order.
+        """
+        texts = list(texts)
+        results = [('neutral', 0.5, {})] * len(texts)
+        if not self.models_loaded:
+            return results
+        
+        positions = [i for i, text in enumerate(texts) if text]
+        if not positions:
+            return results
+            
+        try:
+            with self.metrics.timer('transformer.analyze_batch'):
+                batch = [texts[i] for i in positions]
+                for position, text, inference in zip(positions, batch, self._run_inference_batch(batch)):
+                    results[position] = self._build_mood_result(text, inference)
+                return results
+            
+        except ModelUnavailableError:
+            self.metrics.increment('transformer.unavailable')
+            return [('neutral', 0.5, {})] * len(texts)
+        except Exception as e:
+            logging.error(f"Error in batch mood analysis: {e}")
+            self.metrics.increment('transformer.errors')
+            return [('neutral', 0.5, {})] * len(texts)
+    
+    def _build_mood_result(self, text, inference, trace=None):
+        """Derive the mood result for one text from its model outputs"""
+        # Get emotion classification
+        emotions = inference['emotions']
+        emotion_label = emotions[0]['label']
+        emotion_score = emotions[0]['score']
+        
+        # Get sentiment analysis
+        sentiment = inference['sentiment']
+        sentiment_label = sentiment['label']
+        sentiment_score = sentiment['score']
+        
+        # Get text embedding
+        text_embedding = inference['embedding']
+        
+        # Calculate similarity with each mood
+        similarities = inference.get('mood_scores')
+        if similarities is None:
+            similarities = self.score_moods(text_embedding)[0]
+        
+        # Get the best matching mood
+        best = int(np.argmax(similarities))
+        mood_category = self.mood_names[best]
+        confidence = float(similarities[best])
+        
+        # Attention keywords run their own model, so time them separately
+        with self.metrics.timer('transformer.keywords', trace):
+            keywords = self._extract_relevant_keywords(text)
+        
+        # Create mood context with additional information
+        mood_context = {
+            'emotion': emotion_label,
+            'emotion_confidence': emotion_score,
+            'sentiment': sentiment_label,
+            'sentiment_confidence': sentiment_score,
+            'intensity': self._calculate_intensity(text, sentiment),
+            'temporal': self._detect_temporal_context(text),
+            'keywords': keywords,
+            'mood_scores': self._ranked_distribution(similarities)
+        }
+        
+        return (mood_category, confidence, mood_context)
+    
+    def score_moods(self, embeddings):
+        """
+        Cosine similarity of one or more embeddings against every mood.
+        Returns a (queries x moods) array whose columns follow self.mood_names.
+        """
+        return normalize_rows(embeddings) @ self.mood_matrix.T
+    
+    def rank_moods(self, text):
+        """
+        Full mood distribution for text.
+        Returns a list of (mood, similarity) pairs, best match first.
+        """
+        if not text or not self.models_loaded:
+            return []
+        try:
+            return list(self._ranked_distribution(self.score_moods(self._get_embedding(text))[0]).items())
+        except ModelUnavailableError:
+            return []
+    
+    def _ranked_distribution(self, similarities):
+        """Map a row of mood similarities to a {mood: score} dict ordered best first"""
+        order = np.argsort(-similarities, kind='stable')
+        return {self.mood_names[i]: float(similarities[i]) for i in order}
+    
+    def _run_inference(self, text, trace=None):
+        """
+        Per-request inference plan: run the emotion, sentiment and embedding
+        models exactly once and return their raw outputs for reuse.
+        """
+        timer = self.metrics.timer
+        budget = self.text_budget
+        with timer('transformer.emotion', trace):
+            emotions = self.emotion_classifier(budget.prepare(text, 'emotion'), truncation=True)
+        with timer('transformer.sentiment', trace):
+            sentiment = self.sentiment_analyzer(budget.prepare(text, 'sentiment'), truncation=True)[0]
+        with timer('transformer.embedding', trace):
+            embedding = self._get_embedding(text)
+        return {'emotions': emotions, 'sentiment': sentiment, 'embedding': embedding}
+    
+    def _run_inference_batch(self, texts):
+        """
+        Batch version of _run_inference. Classifier inputs are fitted to their
+        token budgets and run in length-sorted batches so padding stays small.
+        """
+        timer = self.metrics.timer
+        budget = self.text_budget
+        with timer('transformer.emotion_batch'):
+            emotions = budget.run('emotion', texts, lambda batch: self.emotion_classifier(
+                batch, batch_size=len(batch), truncation=True))
+        with timer('transformer.sentiment_batch'):
+            sentiments = budget.run('sentiment', texts, lambda batch: self.sentiment_analyzer(
+                batch, batch_size=len(batch), truncation=True))
+        with timer('transformer.embedding_batch'):
+            embeddings = self._get_embeddings(texts)
+        mood_scores = self.score_moods(embeddings)
+        
+        # Pipelines return one top label per input; keep the single-call shape
+        return [
+            {'emotions': [emotion], 'sentiment': sentiment, 'embedding': embedding, 'mood_scores': scores}
+            for emotion, sentiment, embedding, scores in zip(emotions, sentiments, embeddings, mood_scores)
+        ]
+    
+    def get_content_recommendations(self, text, mood_category, mood_context, query_embedding=None,
+                                    top_k=10, trace=None, embedding_format='list'):
         """
         Get AI-powered content recommendations based on mood and context.
         Returns dict with recommendations and their relevance scores.
+        A precomputed query_embedding for text can be passed to skip re-encoding it.
+        With a content index configured, each content type also lists its top_k items.
+        embedding_format chooses how each search embedding is returned: 'list'
+        (floats), 'none' (left out), or a compact embedding_format encoding
+        ('float32', 'float16', 'int8', 'raw').
         """
+        check_embedding_format(embedding_format)
         if not self.models_loaded:
+            self.metrics.increment('transformer.unavailable')
             return {}
             
         try:
-            # Get embedding for the user's input
-            query_embedding = self._get_embedding(text)
-            
-            # Get mood-specific embedding
-            mood_embedding = self.mood_embeddings.get(mood_category, 
-                                                    self._get_embedding('neutral state of mind'))
+            with self.metrics.timer('recommend.total', trace):
+                return self._recommend(text, mood_category, mood_context, query_embedding, top_k, trace,
+                                       embedding_format)
             
-            # Combine embeddings for search
-            combined_embedding = (query_embedding + mood_embedding) / 2
+        except ModelUnavailableError:
+            self.metrics.increment('transformer.unavailable')
+            return {}
+        except Exception as e:
+            logging.error(f"Error generating recommendations: {e}")
+            self.metrics.increment('recommend.errors')
+            return {}
+    
+    def _recommend(self, text, mood_category, mood_context, query_embedding, top_k, trace, embedding_format):
+        """Body of get_content_recommendations, split out so it can be timed as a whole"""
+        timer = self.metrics.timer
+        
+        # Get embedding for the user's input
+        if query_embedding is None:
+            with timer('recommend.embedding', trace):
+                query_embedding = self._get_embedding(text)
+        
+        # Get mood-specific embedding
+        mood_embedding = self.mood_embeddings.get(mood_category, 
+                                                self._get_embedding('neutral state of mind'))
+        
+        # Combine embeddings for search
+        combined_embedding = (query_embedding + mood_embedding) / 2
+        
+        # Relevance of every content type in one matrix product
+        relevance = self.content_type_matrix @ normalize_rows(combined_embedding)[0]
+        
+        # Get recommendations for each content type
+        recommendations = {}
+        for index, content_type in enumerate(self.content_type_names):
+            type_embedding = self.content_type_embeddings[content_type]
+            # Combine with content type embedding for better matching
+            search_embedding = (combined_embedding + type_embedding) / 2
             
-            # Get recommendations for each content type
-            recommendations = {}
-            for content_type, type_embedding in self.content_type_embeddings.items():
-                # Combine with content type embedding for better matching
-                search_embedding = (combined_embedding + type_embedding) / 2
-                
-                # Get keywords for content search
+            # Get keywords for content search
+            with timer('recommend.keywords', trace):
                 keywords = self._generate_content_keywords(
-                    text, 
+                    text,
                     mood_category,
                     content_type,
                     mood_context
                 )
-                
-                recommendations[content_type] = {
-                    'keywords': keywords,
-                    'embedding': search_embedding.tolist(),
-                    'relevance_score': float(
-                        cosine_similarity([combined_embedding], [type_embedding])[0][0]
-                    )
-                }
             
-            return recommendations
+            recommendations[content_type] = {
+                'keywords': keywords,
+                'relevance_score': float(relevance[index])
+            }
+            if embedding_format != 'none':
+                recommendations[content_type]['embedding'] = encode_embedding(search_embedding, embedding_format)
             
-        except Exception as e:
-            logging.error(f"Error generating recommendations: {e}")
-            return {}
+            # Rank catalog items of this type against the search embedding
+            if self.content_index is not None:
+                with timer('recommend.index_search', trace):
+                    recommendations[content_type]['items'] = self.content_index.search(
+                        search_embedding, top_k, content_type=content_type)
+        
+        return recommendations
     
-    def _calculate_intensity(self, text):
-        """Calculate emotional intensity of text"""
+    def _calculate_intensity(self, text, sentiment=None):
+        """
+        Calculate emotional intensity of text.
+        Reuses an existing sentiment pipeline result when one is passed in.
+        """
         if not self.models_loaded:
             return 'medium'
             
         try:
             # Use sentiment score magnitude as intensity indicator
-            sentiment = self.sentiment_analyzer(text)[0]
+            if sentiment is None:
+                sentiment = self.sentiment_analyzer(text)[0]
             score = abs(sentiment['score'] - 0.5) * 2  # Normalize to 0-1
             
             if score > 0.7:
@@ -208,10 +644,15 @@ class AIRecommender:
         """Extract relevant keywords from text using BERT"""
         if not self.models_loaded:
             return []
+        
+        # Keywords come from attention weights; skip the extra model unless enabled
+        if not self.attention_keywords:
+            return []
             
         try:
             # Tokenize and get model outputs
-            inputs = self.tokenizer(text, return_tensors='pt', truncation=True, max_length=512)
+            inputs = self.tokenizer(self.text_budget.prepare(text, 'keywords'), return_tensors='pt',
+                                    truncation=True, max_length=512)
             outputs = self.model(**inputs)
             
             # Get attention weights from last layer
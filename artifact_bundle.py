@@ -0,0 +1,296 @@
+import argparse
+import hashlib
+import json
+import logging
+import mmap
+import os
+import struct
+import sys
+import threading
+import time
+
+import numpy as np
+
+from caching import CACHE_DIR, atomic_write
+
+# Where MoodAnalyzer and AIRecommender look for a bundle when none is passed in
+BUNDLE_ENV = 'MOODSYNC_BUNDLE'
+DEFAULT_BUNDLE_PATH = os.path.join(CACHE_DIR, 'artifacts.bundle')
+
+# File layout: header (magic, format version, manifest length), the JSON
+# manifest holding the small tables, then each array at a 64-byte aligned offset
+BUNDLE_MAGIC = b'MSBUNDLE'
+BUNDLE_FORMAT_VERSION = 2
+_HEADER = struct.Struct('<8sII')
+_ALIGNMENT = 64
+
+# Bundles opened through ArtifactBundle.open, shared by everything in the process
+_shared = {}
+_shared_lock = threading.Lock()
+
+
+def _aligned(offset):
+    return -(-offset // _ALIGNMENT) * _ALIGNMENT
+
+
+def descriptions_digest(*tables):
+    """Short digest of description dicts, to tell whether bundled embeddings still match them"""
+    return hashlib.sha256(json.dumps(tables, sort_keys=True).encode('utf-8')).hexdigest()[:16]
+
+
+def source_tables():
+    """MoodAnalyzer's tables as this code defines them, in the form build_bundle stores"""
+    import moodanalyser
+
+    return {
+        'mood_keywords': moodanalyser.MOOD_KEYWORDS,
+        'intensity_modifiers': moodanalyser.INTENSITY_MODIFIERS,
+        'emoji_to_mood': moodanalyser.EMOJI_TO_MOOD,
+        'mood_content_keywords': moodanalyser.MOOD_CONTENT_KEYWORDS,
+        'default_content_keywords': moodanalyser.DEFAULT_CONTENT_KEYWORDS
+    }
+
+
+def write_bundle(path, tables, arrays, metadata=None):
+    """
+    Write a bundle of JSON-serializable tables and numpy arrays to path.
+    The file is written with caching.atomic_write, so readers see either the
+    old or the new bundle, never a partial one.
+    Returns the manifest, whose 'version' is a digest of the contents.
+    """
+    arrays = {name: np.ascontiguousarray(array) for name, array in arrays.items()}
+    digest = hashlib.sha256(json.dumps([tables, metadata], sort_keys=True).encode('utf-8'))
+    layout, offset = {}, 0
+    for name, array in arrays.items():
+        digest.update(name.encode('utf-8'))
+        digest.update(array.tobytes())
+        layout[name] = {'dtype': array.dtype.str, 'shape': list(array.shape), 'offset': offset}
+        offset = _aligned(offset + array.nbytes)
+
+    manifest = {
+        'version': digest.hexdigest()[:16],
+        'created': time.strftime('%Y-%m-%dT%H:%M:%SZ', time.gmtime()),
+        'metadata': metadata or {},
+        'tables': tables,
+        'arrays': layout
+    }
+    encoded = json.dumps(manifest, ensure_ascii=False).encode('utf-8')
+    data_start = _aligned(_HEADER.size + len(encoded))
+
+    with atomic_write(path) as f:
+        f.write(_HEADER.pack(BUNDLE_MAGIC, BUNDLE_FORMAT_VERSION, len(encoded)))
+        f.write(encoded)
+        for name, array in arrays.items():
+            f.seek(data_start + layout[name]['offset'])
+            f.write(array.tobytes())
+        f.truncate(data_start + offset)
+    return manifest
+
+
+class ArtifactBundle:
+    """
+    Read-only view of a bundle file.
+    The file is memory-mapped, so arrays are zero-copy views that every
+    process on the host shares through the page cache. reload() switches to
+    a bundle that replaced the file since it was opened; arrays handed out
+    before keep the old mapping alive until they are dropped. Users compare
+    version with the one they built from to notice a swap.
+    """
+
+    def __init__(self, path):
+        self.path = path
+        self._lock = threading.Lock()
+        self._stamp = None
+        self._derived = {}
+        self._open()
+
+    @classmethod
+    def open(cls, path=None):
+        """
+        Open the bundle at path, $MOODSYNC_BUNDLE or DEFAULT_BUNDLE_PATH,
+        sharing one instance per file within the process.
+        Returns None when the default bundle is missing or unreadable; a bundle
+        asked for by path or $MOODSYNC_BUNDLE must exist and be readable.
+        """
+        explicit = path or os.environ.get(BUNDLE_ENV)
+        path = os.path.abspath(explicit or DEFAULT_BUNDLE_PATH)
+        with _shared_lock:
+            if path in _shared:
+                return _shared[path]
+            if not explicit and not os.path.exists(path):
+                return None
+            try:
+                bundle = _shared[path] = cls(path)
+            except (OSError, ValueError) as e:
+                if explicit:
+                    raise
+                logging.error(f"Ignoring unreadable artifact bundle {path}: {e}")
+                return None
+            return bundle
+
+    def _file_stamp(self):
+        stat = os.stat(self.path)
+        return (stat.st_ino, stat.st_mtime_ns, stat.st_size)
+
+    def _open(self):
+        stamp = self._file_stamp()
+        with open(self.path, 'rb') as f:
+            buffer = mmap.mmap(f.fileno(), 0, access=mmap.ACCESS_READ)
+        magic, version, length = _HEADER.unpack_from(buffer)
+        if magic != BUNDLE_MAGIC:
+            raise ValueError(f"{self.path} is not an artifact bundle")
+        if version != BUNDLE_FORMAT_VERSION:
+            raise ValueError(f"Unsupported artifact bundle format {version} in {self.path}")
+        manifest = json.loads(bytes(buffer[_HEADER.size:_HEADER.size + length]).decode('utf-8'))
+
+        data_start = _aligned(_HEADER.size + length)
+        arrays = {}
+        for name, spec in manifest['arrays'].items():
+            dtype = np.dtype(spec['dtype'])
+            count = int(np.prod(spec['shape'], dtype=np.int64))
+            arrays[name] = np.frombuffer(buffer, dtype=dtype, count=count,
+                                         offset=data_start + spec['offset']).reshape(spec['shape'])
+
+        with self._lock:
+            self.manifest = manifest
+            self._arrays = arrays
+            self._stamp = stamp
+            self._derived = {}
+
+    @property
+    def version(self):
+        return self.manifest['version']
+
+    @property
+    def tables(self):
+        return self.manifest['tables']
+
+    @property
+    def metadata(self):
+        return self.manifest['metadata']
+
+    def tables_current(self):
+        """True when the bundled tables were built from the tables this code defines"""
+        return self.metadata.get('tables_digest') == descriptions_digest(source_tables())
+
+    def array(self, name):
+        """Read-only array stored under name, or None"""
+        return self._arrays.get(name)
+
+    def derived(self, name, build):
+        """
+        Object built from this bundle by build(bundle), made once per bundle
+        version and shared by every user in the process (e.g. lookup dicts).
+        """
+        with self._lock:
+            derived = self._derived
+            if name in derived:
+                return derived[name]
+        value = build(self)
+        with self._lock:
+            if derived is self._derived:
+                derived.setdefault(name, value)
+            return derived.get(name, value)
+
+    def reload(self):
+        """
+        Re-open the file if another bundle was moved into its place.
+        Returns True when the contents changed.
+        """
+        try:
+            if self._file_stamp() == self._stamp:
+                return False
+            previous = self.version
+            self._open()
+        except (OSError, ValueError) as e:
+            logging.error(f"Keeping artifact bundle {self.version}; could not reload {self.path}: {e}")
+            return False
+        if self.version != previous:
+            logging.info(f"Artifact bundle {self.path} swapped: {previous} -> {self.version}")
+            return True
+        return False
+
+
+def build_bundle(path=DEFAULT_BUNDLE_PATH, recommender=None, xml_path=None):
+    """
+    Compile MoodAnalyzer's tables, the sentiment lexicon and, when a
+    recommender is given, its mood and content-type embeddings into a bundle.
+    Returns the manifest of the written bundle.
+    """
+    import sentiment_lexicon
+
+    tables = source_tables()
+    forms, scores, modifiers = sentiment_lexicon.lexicon_arrays(xml_path)
+    arrays = {'sentiment_forms': forms, 'sentiment_scores': scores, 'sentiment_modifiers': modifiers}
+    # Lets MoodAnalyzer notice a default bundle built before its tables changed
+    metadata = {'tables_digest': descriptions_digest(tables)}
+
+    if recommender is not None:
+        import ai_recommender
+
+        arrays.update(
+            mood_embeddings=np.stack([recommender.mood_embeddings[mood] for mood in recommender.mood_names]),
+            mood_matrix=recommender.mood_matrix,
+            content_type_embeddings=np.stack([recommender.content_type_embeddings[name]
+                                              for name in recommender.content_type_names]),
+            content_type_matrix=recommender.content_type_matrix
+        )
+        if recommender._model_failed('embedding'):
+            raise RuntimeError("The embedding model is unavailable; cannot bundle reference embeddings")
+        metadata.update(
+            embedding_model=recommender.embedding_model_name,
+            mood_names=recommender.mood_names,
+            content_type_names=recommender.content_type_names,
+            descriptions_digest=descriptions_digest(ai_recommender.MOOD_DESCRIPTIONS,
+                                                    ai_recommender.CONTENT_TYPE_DESCRIPTIONS)
+        )
+
+    return write_bundle(path, tables, arrays, metadata)
+
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description="Build or inspect the MoodSync artifact bundle")
+    commands = parser.add_subparsers(dest='command', required=True)
+
+    build = commands.add_parser('build', help="compile tables, lexicon and reference embeddings")
+    build.add_argument('--output', '-o', default=os.environ.get(BUNDLE_ENV) or DEFAULT_BUNDLE_PATH)
+    build.add_argument('--backend', default='torch', help="inference backend for the reference embeddings")
+    build.add_argument('--sentiment-xml', help="path to en-sentiment.xml (TextBlob's copy by default)")
+    build.add_argument('--no-embeddings', action='store_true',
+                       help="bundle only the lexicon tables (no transformer models needed)")
+    build.add_argument('--offline', action='store_true',
+                       help="embed with benchmark's stub models (checks the pipeline, not real embeddings)")
+
+    info = commands.add_parser('info', help="print a bundle's manifest summary")
+    info.add_argument('path', nargs='?', default=os.environ.get(BUNDLE_ENV) or DEFAULT_BUNDLE_PATH)
+
+    args = parser.parse_args(argv)
+
+    if args.command == 'build':
+        recommender = None
+        if not args.no_embeddings:
+            if args.offline:
+                from benchmark import OfflineRecommender as Recommender
+            else:
+                from ai_recommender import AIRecommender as Recommender
+            recommender = Recommender(backend=args.backend, bundle=False, embedding_cache_size=0)
+        manifest = build_bundle(args.output, recommender, args.sentiment_xml)
+        print(json.dumps({'output': args.output, 'version': manifest['version'],
+                          'bytes': os.path.getsize(args.output), 'arrays': sorted(manifest['arrays'])}))
+        return 0
+
+    bundle = ArtifactBundle(args.path)
+    print(json.dumps({
+        'path': args.path,
+        'version': bundle.version,
+        'created': bundle.manifest['created'],
+        'metadata': bundle.metadata,
+        'tables': {name: len(table) for name, table in bundle.tables.items()},
+        'arrays': {name: spec['shape'] for name, spec in bundle.manifest['arrays'].items()}
+    }, indent=2, ensure_ascii=False))
+    return 0
+
+
+if __name__ == '__main__':
+    logging.basicConfig(level=logging.INFO)
+    sys.exit(main())
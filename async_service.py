@@ -0,0 +1,207 @@
+import asyncio
+import functools
+import inspect
+import logging
+import threading
+from concurrent.futures import ThreadPoolExecutor
+
+from mood_cascade import CascadeAnalyzer
+
+# Content types requested when the caller does not choose
+DEFAULT_CONTENT_TYPES = ('video', 'music', 'podcast')
+
+
+class AsyncMoodService:
+    """
+    asyncio front end for mood analysis and recommendations.
+    Lexicon analysis runs on a bounded CPU thread pool and transformer
+    inference on its own smaller pool, so slow or abandoned transformer calls
+    never queue ahead of lexicon work. Content searches run on a separate I/O
+    pool (or natively when the fetcher is async) and start as soon as the
+    lexicon mood is known, so they overlap with transformer inference. A
+    transformer tier that misses its deadline is abandoned, and one whose pool
+    is already busy is skipped; either way the lexicon result is returned.
+    """
+
+    def __init__(self, analyzer=None, recommender=None, fetcher=None, max_workers=4,
+                 io_workers=16, transformer_timeout=0.5, cascade=None, transformer_workers=1):
+        """
+        analyzer: MoodAnalyzer for the lexicon tier
+        recommender: optional AIRecommender (or RemoteRecommender) for the transformer tier
+        fetcher: optional ContentFetcher, or any object with a (possibly async) fetch()
+        transformer_timeout: seconds the transformer tier may take before degrading
+        cascade: CascadeAnalyzer whose thresholds decide when to escalate
+        transformer_workers: transformer calls allowed in flight, including abandoned
+        ones still running; escalation is skipped while all are busy
+        """
+        self.cascade = cascade or CascadeAnalyzer(lexicon=analyzer, recommender=recommender)
+        self.analyzer = self.cascade.lexicon
+        self.recommender = recommender if recommender is not None else self.cascade.recommender
+        self.fetcher = fetcher
+        self.transformer_timeout = transformer_timeout
+        self._cpu = ThreadPoolExecutor(max_workers=max_workers, thread_name_prefix='mood-cpu')
+        self._io = ThreadPoolExecutor(max_workers=io_workers, thread_name_prefix='mood-io')
+        self.transformer_workers = transformer_workers
+        self._transformer = ThreadPoolExecutor(max_workers=transformer_workers,
+                                               thread_name_prefix='mood-transformer')
+        self._transformer_busy = 0
+        self._transformer_lock = threading.Lock()
+
+    async def __aenter__(self):
+        return self
+
+    async def __aexit__(self, *exc_info):
+        self.close()
+
+    def close(self):
+        """Shut down the worker pools without waiting for abandoned work"""
+        self._cpu.shutdown(wait=False, cancel_futures=True)
+        self._io.shutdown(wait=False, cancel_futures=True)
+        self._transformer.shutdown(wait=False, cancel_futures=True)
+
+    def reload_bundle(self):
+        """Pick up an artifact bundle swapped in by artifact_bundle.py; returns True if anything changed"""
+        changed = self.analyzer.reload_bundle()
+        reload = getattr(self.recommender, 'reload_bundle', None)
+        if reload is not None:
+            changed = reload() or changed
+        return changed
+
+    async def _run_cpu(self, function, *args):
+        return await asyncio.get_running_loop().run_in_executor(self._cpu, function, *args)
+
+    def _submit_transformer(self, function, *args, wait=False):
+        """
+        Run function on the transformer pool and return an awaitable for it.
+        Returns None when every transformer worker is busy, unless wait is True.
+        A call counts as busy until its thread finishes, even after the caller
+        stopped waiting for it.
+        """
+        with self._transformer_lock:
+            if not wait and self._transformer_busy >= self.transformer_workers:
+                return None
+            self._transformer_busy += 1
+        future = self._transformer.submit(function, *args)
+        future.add_done_callback(self._transformer_done)
+        return asyncio.wrap_future(future)
+
+    def _transformer_done(self, future):
+        with self._transformer_lock:
+            self._transformer_busy -= 1
+
+    async def analyze(self, text, timeout=None):
+        """
+        Analyze mood without blocking the event loop.
+        Returns (mood_category, confidence_score, mood_context) like CascadeAnalyzer;
+        mood_context['degraded'] is True when the transformer tier timed out.
+        """
+        return await asyncio.wait_for(self._analyze(text), timeout)
+
+    async def _analyze(self, text, on_lexicon=None):
+        mood, confidence, margin = await self._run_cpu(self.analyzer.analyze_mood_with_margin, text)
+        context = {
+            'tier': CascadeAnalyzer.LEXICON,
+            'lexicon_mood': mood,
+            'lexicon_confidence': confidence,
+            'lexicon_margin': margin,
+            'degraded': False
+        }
+        if on_lexicon is not None:
+            on_lexicon(mood)
+
+        escalate = (text and self.recommender is not None
+                    and self.cascade.needs_fallback(mood, confidence, margin))
+        if not escalate:
+            return (mood, confidence, context)
+
+        try:
+            available = await self._run_cpu(lambda: self.recommender.models_loaded)
+            if available:
+                call = self._submit_transformer(self.recommender.analyze_mood, text)
+                if call is None:
+                    logging.warning("Transformer tier is saturated; using lexicon result")
+                    context['degraded'] = True
+                    return (mood, confidence, context)
+                ai_mood, ai_confidence, ai_context = await asyncio.wait_for(call, self.transformer_timeout)
+                if ai_context:
+                    merged = dict(ai_context)
+                    merged.update(context)
+                    merged['tier'] = CascadeAnalyzer.TRANSFORMER
+                    return (ai_mood, float(ai_confidence), merged)
+        except asyncio.TimeoutError:
+            logging.warning(f"Transformer tier exceeded {self.transformer_timeout}s; using lexicon result")
+            context['degraded'] = True
+        except Exception as e:
+            logging.error(f"Transformer tier failed: {e}")
+            context['degraded'] = True
+
+        return (mood, confidence, context)
+
+    async def _fetch(self, mood, content_type, max_results):
+        keywords = self.analyzer.get_keywords_for_mood(mood, randomize=False)
+        if inspect.iscoroutinefunction(self.fetcher.fetch):
+            return await self.fetcher.fetch(mood, content_type, keywords, max_results)
+        return await asyncio.get_running_loop().run_in_executor(
+            self._io, self.fetcher.fetch, mood, content_type, keywords, max_results)
+
+    def _start_fetches(self, mood, content_types, max_results):
+        return {
+            content_type: asyncio.ensure_future(self._fetch(mood, content_type, max_results))
+            for content_type in content_types
+        }
+
+    async def recommend(self, text, content_types=DEFAULT_CONTENT_TYPES, timeout=None, max_results=10,
+                        embedding_format='list'):
+        """
+        Analyze text and gather content for the detected mood.
+        Returns a dict with 'mood', 'confidence', 'mood_context', 'content' (search
+        results per content type, when a fetcher is configured) and
+        'recommendations' (AIRecommender output, when the transformer tier answered).
+        embedding_format is passed to get_content_recommendations.
+        """
+        return await asyncio.wait_for(
+            self._recommend(text, content_types, max_results, embedding_format), timeout)
+
+    async def _recommend(self, text, content_types, max_results, embedding_format):
+        speculative = {}
+        pending = {}
+
+        def prefetch(mood):
+            # Start searching for the lexicon mood while the transformer tier runs
+            if self.fetcher is not None:
+                speculative[mood] = self._start_fetches(mood, content_types, max_results)
+
+        try:
+            mood, confidence, mood_context = await self._analyze(text, on_lexicon=prefetch)
+
+            if self.fetcher is not None:
+                pending = speculative.pop(mood, None) or self._start_fetches(mood, content_types, max_results)
+
+            recommendations = None
+            if mood_context.get('tier') == CascadeAnalyzer.TRANSFORMER:
+                recommendations = await self._submit_transformer(functools.partial(
+                    self.recommender.get_content_recommendations, text, mood, mood_context,
+                    embedding_format=embedding_format), wait=True)
+
+            content = {}
+            if pending:
+                results = await asyncio.gather(*pending.values(), return_exceptions=True)
+                for content_type, result in zip(pending, results):
+                    if isinstance(result, Exception):
+                        logging.error(f"Content fetch failed for {content_type}: {result}")
+                        result = []
+                    content[content_type] = result
+
+            return {
+                'mood': mood,
+                'confidence': confidence,
+                'mood_context': mood_context,
+                'content': content,
+                'recommendations': recommendations
+            }
+        finally:
+            # Speculative searches for a mood we did not pick are no longer needed,
+            # and nor are the chosen ones if we were cancelled or timed out
+            for tasks in [*speculative.values(), pending]:
+                for task in tasks.values():
+                    task.cancel()
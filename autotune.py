@@ -0,0 +1,291 @@
+import argparse
+import importlib
+import itertools
+import json
+import logging
+import multiprocessing
+import os
+import platform
+import queue
+import sys
+import time
+
+import numpy as np
+
+from caching import CACHE_DIR, atomic_write
+
+# Where AIRecommender looks for a tuning file when none is passed in
+TUNING_ENV = 'MOODSYNC_TUNING_CONFIG'
+DEFAULT_TUNING_PATH = os.path.join(CACHE_DIR, 'tuning.json')
+
+TUNED_STAGES = ('emotion', 'sentiment', 'embedding')
+
+# Native thread pools that follow the torch intra-op setting when set before import
+THREAD_ENV_VARS = ('OMP_NUM_THREADS', 'MKL_NUM_THREADS', 'OPENBLAS_NUM_THREADS')
+
+
+def host_info():
+    """Facts identifying the machine a tuning result applies to"""
+    return {
+        'hostname': platform.node(),
+        'machine': platform.machine(),
+        'processor': platform.processor(),
+        'cpu_count': os.cpu_count(),
+        'python': platform.python_version()
+    }
+
+
+def load_tuning(path=None):
+    """
+    Read the recommended settings from a tuning file.
+    path defaults to $MOODSYNC_TUNING_CONFIG, then DEFAULT_TUNING_PATH.
+    Returns the 'recommended' dict, or None when there is no usable file.
+    """
+    path = path or os.environ.get(TUNING_ENV) or DEFAULT_TUNING_PATH
+    try:
+        with open(path, encoding='utf-8') as f:
+            config = json.load(f)
+    except FileNotFoundError:
+        return None
+    except (OSError, ValueError) as e:
+        logging.error(f"Ignoring unreadable tuning file {path}: {e}")
+        return None
+
+    tuned_for = config.get('host', {}).get('cpu_count')
+    if tuned_for and tuned_for != os.cpu_count():
+        logging.warning(f"Tuning file {path} was made for {tuned_for} CPUs; this host has {os.cpu_count()}")
+    return config.get('recommended')
+
+
+def apply_thread_settings(tuning):
+    """
+    Apply torch_threads / interop_threads from a tuning dict to this process.
+    Before torch is imported this sets the OpenMP/MKL environment (explicit
+    settings already in the environment win); once it is imported it calls
+    torch.set_num_threads and, where torch still allows it,
+    torch.set_num_interop_threads.
+    """
+    if not tuning:
+        return
+    threads = tuning.get('torch_threads')
+    interop = tuning.get('interop_threads')
+
+    if 'torch' not in sys.modules:
+        if threads:
+            for name in THREAD_ENV_VARS:
+                os.environ.setdefault(name, str(threads))
+        return
+
+    torch = sys.modules['torch']
+    if threads:
+        torch.set_num_threads(threads)
+    if interop:
+        try:
+            torch.set_num_interop_threads(interop)
+        except RuntimeError:
+            # Only settable before the first inter-op parallel work in this process
+            logging.debug("torch inter-op threads already fixed; keeping the current value")
+
+
+def _load_factory(spec):
+    """Resolve 'module:ClassName' to the class"""
+    module_name, _, class_name = spec.partition(':')
+    return getattr(importlib.import_module(module_name), class_name)
+
+
+def _stage_fn(recommender, stage, batch_size):
+    if stage == 'emotion':
+        return lambda batch: recommender.emotion_classifier(batch, batch_size=batch_size, truncation=True)
+    if stage == 'sentiment':
+        return lambda batch: recommender.sentiment_analyzer(batch, batch_size=batch_size, truncation=True)
+    return lambda batch: recommender.sentence_transformer.encode(batch, batch_size=batch_size)
+
+
+def _trial_worker(factory, backend, threads, batch_size, stages, texts, duration, barrier, results,
+                  startup_timeout):
+    """
+    One worker process of a trial: load models, wait for the others, then run
+    batches for duration. Puts ('ok', items, seconds, latencies) on results, or
+    ('error', message) if anything fails, breaking the barrier so the other
+    workers stop waiting.
+    """
+    try:
+        tuning = {'torch_threads': threads, 'interop_threads': 1}
+        apply_thread_settings(tuning)
+        recommender = _load_factory(factory)(backend=backend, tuning=tuning, embedding_cache_size=0)
+        recommender.warmup(stages)
+        functions = [_stage_fn(recommender, stage, batch_size) for stage in stages]
+        batches = [texts[start:start + batch_size] for start in range(0, len(texts), batch_size)]
+
+        barrier.wait(startup_timeout)
+        latencies = []
+        items = 0
+        start = time.perf_counter()
+        for batch in itertools.cycle(batches):
+            call_start = time.perf_counter()
+            for function in functions:
+                function(batch)
+            latencies.append(time.perf_counter() - call_start)
+            items += len(batch)
+            if time.perf_counter() - start >= duration:
+                break
+        results.put(('ok', items, time.perf_counter() - start, latencies))
+    except BaseException as e:
+        barrier.abort()
+        results.put(('error', f"{type(e).__name__}: {e}"))
+
+
+def _stop(processes, timeout=0.0):
+    """Give trial workers timeout seconds to exit, then terminate the rest"""
+    for process in processes:
+        process.join(timeout)
+    for process in processes:
+        if process.is_alive():
+            process.terminate()
+            process.join()
+
+
+def run_trial(workers, threads, batch_size, texts, factory='ai_recommender:AIRecommender',
+              backend='torch', stages=TUNED_STAGES, duration=5.0, startup_timeout=300.0):
+    """
+    Measure one (workers, threads, batch size) combination: workers processes
+    run every stage on batches of texts at the same time, as they would
+    behind a multi-worker server. Returns throughput and batch latency.
+    Raises RuntimeError if a worker fails, dies, or the trial does not finish
+    within startup_timeout (model loading) plus duration.
+    """
+    # Spawned children pick up their thread settings before torch is imported
+    context = multiprocessing.get_context('spawn')
+    barrier = context.Barrier(workers)
+    results = context.Queue()
+    processes = [
+        context.Process(target=_trial_worker, args=(
+            factory, backend, threads, batch_size, tuple(stages), texts, duration, barrier, results,
+            startup_timeout))
+        for _ in range(workers)
+    ]
+    for process in processes:
+        process.start()
+
+    deadline = time.monotonic() + startup_timeout + duration * 2 + 30.0
+    outcomes = []
+    try:
+        while len(outcomes) < workers:
+            try:
+                outcome = results.get(timeout=1.0)
+            except queue.Empty:
+                crashed = [p.exitcode for p in processes if p.exitcode not in (None, 0)]
+                if crashed:
+                    raise RuntimeError(f"Trial worker exited with code {crashed[0]}")
+                if time.monotonic() > deadline:
+                    raise RuntimeError(f"Trial timed out after {startup_timeout + duration:.0f}s")
+                continue
+            if outcome[0] == 'error':
+                raise RuntimeError(f"Trial worker failed: {outcome[1]}")
+            outcomes.append(outcome[1:])
+    finally:
+        # Workers that reported are exiting on their own; anything else is stuck or failed
+        _stop(processes, 10.0 if len(outcomes) == workers else 0.0)
+    crashed = [p.exitcode for p in processes if p.exitcode != 0]
+    if crashed:
+        raise RuntimeError(f"Trial worker exited with code {crashed[0]}")
+
+    items = sum(count for count, _, _ in outcomes)
+    elapsed = max(seconds for _, seconds, _ in outcomes)
+    latencies = np.array([latency for _, _, batch_latencies in outcomes for latency in batch_latencies]) * 1000.0
+    return {
+        'workers': workers,
+        'torch_threads': threads,
+        'batch_size': batch_size,
+        'messages_per_second': items / elapsed if elapsed else 0.0,
+        'batch_p50_ms': float(np.percentile(latencies, 50)),
+        'batch_p95_ms': float(np.percentile(latencies, 95)),
+        'message_p95_ms': float(np.percentile(latencies, 95)) / batch_size
+    }
+
+
+def candidate_grid(cpu_count, workers=None, threads=None, batch_sizes=(1, 8, 16, 32)):
+    """
+    Worker/thread/batch combinations worth measuring: by default powers of two
+    up to the core count, skipping splits that use more threads than cores.
+    """
+    powers = [n for n in (1, 2, 4, 8, 16, 32, 64) if n <= cpu_count] or [1]
+    grid = []
+    for worker_count, thread_count, batch_size in itertools.product(
+            workers or powers, threads or powers, batch_sizes):
+        if worker_count * thread_count <= max(cpu_count, 1):
+            grid.append((worker_count, thread_count, batch_size))
+    return grid
+
+
+def recommend(results, max_p95_ms=None):
+    """
+    Pick the highest-throughput trial whose per-message p95 latency is within
+    max_p95_ms (or the lowest-latency trial when none is).
+    """
+    eligible = [r for r in results if max_p95_ms is None or r['message_p95_ms'] <= max_p95_ms]
+    if eligible:
+        best = max(eligible, key=lambda r: r['messages_per_second'])
+    else:
+        best = min(results, key=lambda r: r['message_p95_ms'])
+    return {
+        'workers': best['workers'],
+        'torch_threads': best['torch_threads'],
+        'interop_threads': 1,
+        'batch_size': best['batch_size']
+    }
+
+
+def tune(texts, grid, factory='ai_recommender:AIRecommender', backend='torch', duration=5.0, max_p95_ms=None):
+    """Run every trial in grid and return the full tuning report"""
+    results = []
+    for workers, threads, batch_size in grid:
+        try:
+            result = run_trial(workers, threads, batch_size, texts, factory, backend, duration=duration)
+        except RuntimeError as e:
+            logging.error(f"Skipping workers={workers} threads={threads} batch={batch_size}: {e}")
+            continue
+        logging.info(f"workers={workers} threads={threads} batch={batch_size}: "
+                     f"{result['messages_per_second']:.1f} msg/s, p95 {result['message_p95_ms']:.1f} ms/msg")
+        results.append(result)
+    if not results:
+        raise RuntimeError("Every tuning trial failed")
+    return {
+        'host': host_info(),
+        'backend': backend,
+        'created': time.strftime('%Y-%m-%dT%H:%M:%SZ', time.gmtime()),
+        'max_p95_ms': max_p95_ms,
+        'recommended': recommend(results, max_p95_ms),
+        'results': results
+    }
+
+
+def main(argv=None):
+    from benchmark import generate_corpus
+
+    parser = argparse.ArgumentParser(description="Find worker, torch thread and batch settings for this host")
+    parser.add_argument('--output', '-o', default=os.environ.get(TUNING_ENV) or DEFAULT_TUNING_PATH)
+    parser.add_argument('--backend', default='torch')
+    parser.add_argument('--workers', type=int, nargs='*', help="worker counts to try")
+    parser.add_argument('--threads', type=int, nargs='*', help="torch thread counts to try")
+    parser.add_argument('--batch-sizes', type=int, nargs='*', default=[1, 8, 16, 32])
+    parser.add_argument('--duration', type=float, default=5.0, help="seconds per trial")
+    parser.add_argument('--messages', type=int, default=256)
+    parser.add_argument('--max-p95-ms', type=float, help="per-message p95 latency limit")
+    parser.add_argument('--offline', action='store_true',
+                        help="use benchmark's stub models (checks the harness, not real inference)")
+    args = parser.parse_args(argv)
+
+    factory = 'benchmark:OfflineRecommender' if args.offline else 'ai_recommender:AIRecommender'
+    grid = candidate_grid(os.cpu_count() or 1, args.workers, args.threads, args.batch_sizes)
+    report = tune(generate_corpus(args.messages), grid, factory, args.backend, args.duration, args.max_p95_ms)
+
+    with atomic_write(args.output, 'w', encoding='utf-8') as f:
+        json.dump(report, f, indent=2)
+    print(json.dumps(report['recommended']))
+    return 0
+
+
+if __name__ == '__main__':
+    logging.basicConfig(level=logging.INFO)
+    sys.exit(main())
@@ -0,0 +1,187 @@
+import logging
+import queue
+import threading
+import time
+from collections import Counter
+from concurrent.futures import Future
+
+
+class MicroBatcher:
+    """
+    Coalesce concurrent single-item requests into batches.
+    Callers submit one item and block on a Future; a background thread gathers
+    items for up to max_wait_ms (or until max_batch_size is reached), runs
+    batch_fn once on the whole list and hands each caller its own result.
+    """
+
+    _STOP = object()
+
+    def __init__(self, batch_fn, max_batch_size=16, max_wait_ms=5.0, name='batcher'):
+        """
+        batch_fn: callable taking a list of items and returning a list of results
+        in the same order
+        """
+        if max_batch_size < 1:
+            raise ValueError("max_batch_size must be >= 1")
+        self.batch_fn = batch_fn
+        self.max_batch_size = max_batch_size
+        self.max_wait = max_wait_ms / 1000.0
+        self.name = name
+
+        self._queue = queue.Queue()
+        self._lock = threading.Lock()
+        self._batches = 0
+        self._items = 0
+        self._batch_sizes = Counter()
+        self._closed = False
+
+        self._worker = threading.Thread(target=self._run, name=name, daemon=True)
+        self._worker.start()
+
+    def submit(self, item):
+        """Queue one item and return a Future for its result"""
+        if self._closed:
+            raise RuntimeError(f"{self.name} is closed")
+        future = Future()
+        self._queue.put((item, future))
+        return future
+
+    def __call__(self, item, timeout=None):
+        """Submit one item and wait for its result"""
+        return self.submit(item).result(timeout)
+
+    def _collect(self):
+        """Block for the first item, then gather more until the batch is full or the wait expires"""
+        first = self._queue.get()
+        if first is self._STOP:
+            return None
+        batch = [first]
+        deadline = time.monotonic() + self.max_wait
+        while len(batch) < self.max_batch_size:
+            remaining = deadline - time.monotonic()
+            try:
+                entry = self._queue.get(timeout=remaining) if remaining > 0 else self._queue.get_nowait()
+            except queue.Empty:
+                break
+            if entry is self._STOP:
+                # Finish this batch, then stop on the next collect
+                self._queue.put(self._STOP)
+                break
+            batch.append(entry)
+        return batch
+
+    def _run(self):
+        while True:
+            batch = self._collect()
+            if batch is None:
+                return
+
+            # Skip callers that gave up before their batch ran
+            batch = [(item, future) for item, future in batch if future.set_running_or_notify_cancel()]
+            if not batch:
+                continue
+
+            with self._lock:
+                self._batches += 1
+                self._items += len(batch)
+                self._batch_sizes[len(batch)] += 1
+
+            try:
+                results = self.batch_fn([item for item, _ in batch])
+                if len(results) != len(batch):
+                    raise RuntimeError(
+                        f"{self.name}: batch_fn returned {len(results)} results for {len(batch)} items")
+            except Exception as e:
+                logging.error(f"Error in {self.name} batch: {e}")
+                for _, future in batch:
+                    future.set_exception(e)
+                continue
+
+            for (_, future), result in zip(batch, results):
+                future.set_result(result)
+
+    def close(self, timeout=None):
+        """Stop accepting items and wait for queued work to finish"""
+        if self._closed:
+            return
+        self._closed = True
+        self._queue.put(self._STOP)
+        self._worker.join(timeout)
+
+    def stats(self):
+        """Get queue depth and batch-size metrics"""
+        with self._lock:
+            return {
+                'queue_depth': self._queue.qsize(),
+                'batches': self._batches,
+                'items': self._items,
+                'avg_batch_size': self._items / self._batches if self._batches else 0.0,
+                'batch_size_histogram': dict(sorted(self._batch_sizes.items()))
+            }
+
+
+class BatchingRecommender:
+    """
+    Drop-in wrapper around AIRecommender for multi-threaded servers.
+    Concurrent analyze_mood calls share one emotion/sentiment/embedding pass per
+    batch, and get_content_recommendations shares batched query encoding.
+    """
+
+    def __init__(self, recommender, max_batch_size=16, max_wait_ms=5.0):
+        self.recommender = recommender
+        self._mood_batcher = MicroBatcher(
+            recommender.analyze_moods, max_batch_size, max_wait_ms, name='mood-batcher')
+        self._embedding_batcher = MicroBatcher(
+            recommender._get_embeddings, max_batch_size, max_wait_ms, name='embedding-batcher')
+
+    @property
+    def models_loaded(self):
+        return self.recommender.models_loaded
+
+    def analyze_mood(self, text, trace=None, *, timeout=None):
+        """
+        Same contract as AIRecommender.analyze_mood, served from a shared batch.
+        trace records the whole wait, queueing included; timeout bounds it.
+        """
+        if not text or not self.recommender.models_loaded:
+            return ('neutral', 0.5, {})
+        start = time.perf_counter()
+        result = self._mood_batcher(text, timeout)
+        if trace is not None:
+            trace.record('transformer.analyze_batched', time.perf_counter() - start)
+        return result
+
+    def get_content_recommendations(self, text, mood_category, mood_context, query_embedding=None,
+                                    top_k=10, trace=None, embedding_format='list', *, timeout=None):
+        """
+        Same contract as AIRecommender.get_content_recommendations; the query
+        is encoded in a shared batch unless query_embedding is given.
+        timeout bounds the wait for that batch.
+        """
+        if not self.recommender.models_loaded:
+            return {}
+        if query_embedding is None:
+            start = time.perf_counter()
+            try:
+                query_embedding = self._embedding_batcher(text, timeout)
+            except Exception:
+                # The encoder failed to load in this batch: same answer as AIRecommender
+                if not self.recommender.models_loaded:
+                    return {}
+                raise
+            if trace is not None:
+                trace.record('recommend.encode_batched', time.perf_counter() - start)
+        return self.recommender.get_content_recommendations(
+            text, mood_category, mood_context, query_embedding=query_embedding, top_k=top_k,
+            trace=trace, embedding_format=embedding_format)
+
+    def stats(self):
+        """Get metrics for each underlying batcher"""
+        return {
+            'mood': self._mood_batcher.stats(),
+            'embedding': self._embedding_batcher.stats()
+        }
+
+    def close(self):
+        self._mood_batcher.close()
+        self._embedding_batcher.close()
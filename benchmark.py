@@ -0,0 +1,307 @@
+import argparse
+import hashlib
+import json
+import multiprocessing
+import platform
+import random
+import resource
+import subprocess
+import sys
+import time
+from concurrent.futures import ProcessPoolExecutor
+
+import numpy as np
+
+from ai_recommender import AIRecommender, EMBEDDING_DIM
+from moodanalyser import MoodAnalyzer
+
+# Vocabulary for the synthetic corpus
+FILLER_WORDS = ['i', 'am', 'feeling', 'today', 'the', 'work', 'day', 'was', 'and', 'my', 'friends',
+                'just', 'really', 'so', 'a', 'bit', 'kind', 'of', 'this', 'week', 'after', 'movie']
+MOOD_WORDS = ['happy', 'sad', 'calm', 'pumped', 'focused', 'angry', 'worried', 'bored', 'nostalgic',
+              'romantic', 'great', 'terrible', 'excited', 'gloomy', 'stressed', 'deep work', 'tired of']
+NEGATION_WORDS = ['not', "don't", "isn't", 'never', 'no', "can't"]
+EMOJIS = ['😊', '😢', '🔥', '😴', '🧠', '😡', '😰', '🥱', '📷', '❤️', '👩‍❤️‍👨', '☺️', '👍🏽']
+
+# Message shapes: (min words, max words, emoji rate, negation rate)
+PROFILES = {
+    'short': (2, 6, 0.05, 0.05),
+    'long': (60, 200, 0.05, 0.05),
+    'emoji': (3, 12, 0.6, 0.05),
+    'negation': (5, 20, 0.05, 0.4)
+}
+
+
+def generate_corpus(count, seed=0, profiles=tuple(PROFILES)):
+    """
+    Seeded synthetic chat messages, cycling through the given profiles.
+    The same (count, seed, profiles) always yields the same corpus.
+    """
+    rng = random.Random(seed)
+    corpus = []
+    for i in range(count):
+        min_words, max_words, emoji_rate, negation_rate = PROFILES[profiles[i % len(profiles)]]
+        words = []
+        for _ in range(rng.randint(min_words, max_words)):
+            roll = rng.random()
+            if roll < emoji_rate:
+                words.append(rng.choice(EMOJIS))
+            elif roll < emoji_rate + negation_rate:
+                words.append(rng.choice(NEGATION_WORDS))
+            elif roll < emoji_rate + negation_rate + 0.2:
+                words.append(rng.choice(MOOD_WORDS))
+            else:
+                words.append(rng.choice(FILLER_WORDS))
+        corpus.append(' '.join(words))
+    return corpus
+
+
+def _hash_vector(text, dim, salt=''):
+    """Deterministic pseudo-embedding built from hashed tokens"""
+    vector = np.zeros(dim, dtype=np.float32)
+    for token in text.lower().split():
+        digest = hashlib.blake2b((salt + token).encode('utf-8'), digest_size=8).digest()
+        bucket = int.from_bytes(digest[:4], 'little') % dim
+        vector[bucket] += 1.0 if digest[4] & 1 else -1.0
+    return vector
+
+
+class _StubPipeline:
+    """Tiny text-classification pipeline with the transformers call signature"""
+
+    def __init__(self, labels, salt):
+        self.labels = labels
+        self.salt = salt
+
+    def _classify(self, text):
+        scores = _hash_vector(text, len(self.labels), self.salt)
+        probabilities = np.exp(scores - scores.max())
+        probabilities /= probabilities.sum()
+        best = int(np.argmax(probabilities))
+        return {'label': self.labels[best], 'score': float(probabilities[best])}
+
+    def __call__(self, texts, **kwargs):
+        if isinstance(texts, str):
+            return [self._classify(texts)]
+        return [self._classify(text) for text in texts]
+
+
+class _StubEncoder:
+    """Tiny sentence encoder with the SentenceTransformer.encode signature"""
+
+    def encode(self, texts, **kwargs):
+        if isinstance(texts, str):
+            return _hash_vector(texts, EMBEDDING_DIM, 'embed')
+        return np.stack([_hash_vector(text, EMBEDDING_DIM, 'embed') for text in texts])
+
+
+class OfflineRecommender(AIRecommender):
+    """
+    AIRecommender wired to tiny deterministic stub models.
+    Measures the recommender's own orchestration, caching and scoring code
+    without downloading or running real transformers.
+    """
+
+    def __init__(self, *args, **kwargs):
+        super().__init__(*args, **kwargs)
+        # Keeps stub reference embeddings in an artifact bundle apart from real ones
+        self.embedding_model_name = 'benchmark-stub'
+
+    def _create_emotion_model(self):
+        return _StubPipeline(['joy', 'sadness', 'anger', 'fear', 'surprise', 'disgust', 'neutral'], 'emotion')
+
+    def _create_sentiment_model(self):
+        return _StubPipeline(['POSITIVE', 'NEGATIVE'], 'sentiment')
+
+    def _create_embedding_model(self):
+        return _StubEncoder()
+
+
+def _peak_rss_mb():
+    """Peak resident set size of this process in MB"""
+    peak = resource.getrusage(resource.RUSAGE_SELF).ru_maxrss
+    # ru_maxrss is KB on Linux and bytes on macOS
+    return peak / (1024 * 1024) if sys.platform == 'darwin' else peak / 1024
+
+
+def _measure(function, items, repeat=1):
+    """Call function on each item, returning latency percentiles and throughput"""
+    latencies = []
+    start = time.perf_counter()
+    for _ in range(repeat):
+        for item in items:
+            call_start = time.perf_counter()
+            function(item)
+            latencies.append(time.perf_counter() - call_start)
+    elapsed = time.perf_counter() - start
+    latencies = np.array(latencies) * 1000.0
+    return {
+        'calls': len(latencies),
+        'seconds': elapsed,
+        'p50_ms': float(np.percentile(latencies, 50)),
+        'p95_ms': float(np.percentile(latencies, 95)),
+        'p99_ms': float(np.percentile(latencies, 99)),
+        'mean_ms': float(latencies.mean())
+    }
+
+
+def _batches(items, size):
+    return [items[start:start + size] for start in range(0, len(items), size)]
+
+
+def _cases(corpus, batch_size):
+    """Benchmark cases as name -> (setup, call, items, messages per item)"""
+    canned = ["I'm feeling happy", "I'm feeling sad", "I'm feeling relaxed", "I'm feeling focused"]
+    return {
+        'lexicon.analyze_mood': (
+            lambda: MoodAnalyzer(cache_size=0, sentiment_cache_size=0),
+            lambda analyzer, text: analyzer.analyze_mood(text), corpus, 1),
+        'lexicon.analyze_mood.canned_cached': (
+            MoodAnalyzer,
+            lambda analyzer, text: analyzer.analyze_mood(text), canned * (len(corpus) // len(canned) or 1), 1),
+        'lexicon.analyze_moods.batch': (
+            lambda: MoodAnalyzer(cache_size=0, sentiment_cache_size=0),
+            lambda analyzer, texts: analyzer.analyze_moods(texts), _batches(corpus, batch_size), batch_size),
+        'transformer.analyze_mood': (
+            lambda: OfflineRecommender(embedding_cache_size=0),
+            lambda recommender, text: recommender.analyze_mood(text), corpus, 1),
+        'transformer.analyze_moods.batch': (
+            lambda: OfflineRecommender(embedding_cache_size=0),
+            lambda recommender, texts: recommender.analyze_moods(texts), _batches(corpus, batch_size), batch_size),
+        'transformer.get_content_recommendations': (
+            lambda: OfflineRecommender(embedding_cache_size=0),
+            lambda recommender, text: recommender.get_content_recommendations(text, 'happy', {'emotion': 'joy'}),
+            corpus, 1)
+    }
+
+
+def _git_commit():
+    try:
+        return subprocess.run(['git', 'rev-parse', '--short', 'HEAD'], capture_output=True,
+                              text=True, check=True).stdout.strip()
+    except (OSError, subprocess.CalledProcessError):
+        return None
+
+
+def _run_case(name, corpus, seed, batch_size, repeat):
+    """Set up, warm and time one case; peak RSS covers only the calling process"""
+    setup, call, items, per_item = _cases(corpus, batch_size)[name]
+    random.seed(seed)
+    np.random.seed(seed)
+    subject = setup()
+    # Warm lazy state (models, reference embeddings) outside the timed loop
+    call(subject, items[0])
+    rss_before = _peak_rss_mb()
+    stats = _measure(lambda item: call(subject, item), items, repeat)
+    stats['messages_per_second'] = stats['calls'] * per_item / stats['seconds'] if stats['seconds'] else None
+    stats['batch_size'] = per_item
+    stats['peak_rss_mb'] = _peak_rss_mb()
+    stats['peak_rss_growth_mb'] = stats['peak_rss_mb'] - rss_before
+    return stats
+
+
+def run_benchmarks(messages=2000, seed=0, batch_size=64, repeat=1, select=None, isolate=True):
+    """
+    Run the benchmark cases whose names start with any prefix in select (all by default).
+    With isolate, each case runs in a freshly spawned process, so its peak_rss_mb
+    is that case's own high-water mark rather than the largest of every case so far.
+    Returns a JSON-serializable report.
+    """
+    corpus = generate_corpus(messages, seed)
+    results = {}
+    for name in _cases(corpus, batch_size):
+        if select and not any(name.startswith(prefix) for prefix in select):
+            continue
+        if not isolate:
+            results[name] = _run_case(name, corpus, seed, batch_size, repeat)
+            continue
+        # spawn rather than fork: a forked child inherits the parent's RSS high-water mark
+        with ProcessPoolExecutor(max_workers=1, mp_context=multiprocessing.get_context('spawn')) as executor:
+            results[name] = executor.submit(_run_case, name, corpus, seed, batch_size, repeat).result()
+
+    return {
+        'meta': {
+            'commit': _git_commit(),
+            'timestamp': time.strftime('%Y-%m-%dT%H:%M:%SZ', time.gmtime()),
+            'python': platform.python_version(),
+            'platform': platform.platform(),
+            'machine': platform.machine(),
+            'messages': messages,
+            'seed': seed,
+            'batch_size': batch_size,
+            'repeat': repeat,
+            'isolated': isolate,
+            'corpus_sha1': hashlib.sha1('\n'.join(corpus).encode('utf-8')).hexdigest()
+        },
+        'results': results
+    }
+
+
+def compare_reports(baseline, current, threshold=0.10, metric='p50_ms'):
+    """
+    Compare two reports case by case.
+    Returns a list of (case, baseline value, current value, relative change, regressed)
+    where regressed means the metric got worse by more than threshold.
+    """
+    higher_is_better = metric == 'messages_per_second'
+    rows = []
+    for case, stats in sorted(current['results'].items()):
+        before = baseline['results'].get(case, {}).get(metric)
+        after = stats.get(metric)
+        if not before or after is None:
+            continue
+        change = (after - before) / before
+        regressed = -change > threshold if higher_is_better else change > threshold
+        rows.append((case, before, after, change, regressed))
+    return rows
+
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description="Reproducible MoodSync analyzer benchmarks")
+    commands = parser.add_subparsers(dest='command', required=True)
+
+    run = commands.add_parser('run', help="run benchmarks and write a JSON report")
+    run.add_argument('--output', '-o', help="report path (stdout when omitted)")
+    run.add_argument('--messages', type=int, default=2000)
+    run.add_argument('--seed', type=int, default=0)
+    run.add_argument('--batch-size', type=int, default=64)
+    run.add_argument('--repeat', type=int, default=1)
+    run.add_argument('--cases', nargs='*', help="case name prefixes, e.g. lexicon transformer.analyze_mood")
+    run.add_argument('--in-process', action='store_true',
+                     help="run every case in this process (faster; peak_rss_mb is then cumulative)")
+
+    compare = commands.add_parser('compare', help="compare two reports; exit 1 on regressions")
+    compare.add_argument('baseline')
+    compare.add_argument('current')
+    compare.add_argument('--threshold', type=float, default=0.10)
+    compare.add_argument('--metric', default='p50_ms',
+                         choices=['p50_ms', 'p95_ms', 'p99_ms', 'mean_ms', 'messages_per_second'])
+
+    args = parser.parse_args(argv)
+
+    if args.command == 'run':
+        report = run_benchmarks(args.messages, args.seed, args.batch_size, args.repeat, args.cases,
+                                isolate=not args.in_process)
+        text = json.dumps(report, indent=2)
+        if args.output:
+            with open(args.output, 'w', encoding='utf-8') as f:
+                f.write(text + '\n')
+        else:
+            print(text)
+        return 0
+
+    with open(args.baseline, encoding='utf-8') as f:
+        baseline = json.load(f)
+    with open(args.current, encoding='utf-8') as f:
+        current = json.load(f)
+
+    regressions = 0
+    for case, before, after, change, regressed in compare_reports(baseline, current, args.threshold, args.metric):
+        regressions += regressed
+        flag = 'REGRESSION' if regressed else 'ok'
+        print(f"{case:45s} {before:12.4f} -> {after:12.4f} {change:+8.1%}  {flag}")
+    return 1 if regressions else 0
+
+
+if __name__ == '__main__':
+    sys.exit(main())
@@ -0,0 +1,301 @@
+import argparse
+import csv
+import itertools
+import json
+import logging
+import multiprocessing
+import os
+import sys
+import time
+from collections import deque
+from concurrent.futures import ProcessPoolExecutor
+
+import autotune
+from mood_cascade import CascadeAnalyzer
+from moodanalyser import MoodAnalyzer
+
+INPUT_FORMATS = ('jsonl', 'csv')
+OUTPUT_FIELDS = ('id', 'mood', 'confidence', 'margin', 'tier', 'emotion', 'sentiment', 'error')
+
+# Per-process scoring state, set up once by _init_worker
+_worker = {}
+
+
+def detect_format(path, default='jsonl'):
+    """Guess the record format from a file extension"""
+    if path and path.lower().endswith('.csv'):
+        return 'csv'
+    return default
+
+
+def read_records(stream, input_format='jsonl', text_field='text', id_field='id'):
+    """
+    Stream (id, text, error) records from JSONL or CSV input.
+    Records without an id field are numbered by position; malformed JSON
+    lines yield an error instead of stopping the run.
+    """
+    if input_format == 'csv':
+        rows = ((row, None) for row in csv.DictReader(stream))
+    else:
+        rows = (_parse_json_line(line) for line in stream if line.strip())
+
+    for number, (row, error) in enumerate(rows):
+        if error is not None:
+            yield (number, None, error)
+            continue
+        record_id = row.get(id_field, number) if isinstance(row, dict) else number
+        text = row.get(text_field) if isinstance(row, dict) else None
+        if text is not None and not isinstance(text, str):
+            text = str(text)
+        yield (record_id, text, None if isinstance(row, dict) else "record is not an object")
+
+
+def _parse_json_line(line):
+    try:
+        return json.loads(line), None
+    except json.JSONDecodeError as e:
+        return None, f"invalid JSON: {e}"
+
+
+def _init_worker(transformer, model_server, backend, thresholds):
+    """Build this process's analyzers; an inherited (pre-forked) recommender is reused"""
+    recommender = _worker.get('recommender')
+    if transformer and recommender is None:
+        if model_server:
+            from model_server import RemoteRecommender
+            recommender = RemoteRecommender(model_server)
+        else:
+            from ai_recommender import AIRecommender
+            recommender = AIRecommender(backend=backend)
+    analyzer = MoodAnalyzer()
+    _worker['cascade'] = CascadeAnalyzer(lexicon=analyzer, recommender=recommender, **thresholds)
+
+
+def score_chunk(records):
+    """
+    Score one chunk of (id, text, error) records.
+    The lexicon tier runs over the whole chunk as one batch; records it is
+    unsure about go to the transformer tier together in a second batch.
+    """
+    cascade = _worker['cascade']
+    results = [{'id': record_id, 'error': error} if error else {'id': record_id}
+               for record_id, _, error in records]
+    positions = [i for i, (_, text, error) in enumerate(records) if not error]
+    texts = [records[i][1] or '' for i in positions]
+
+    escalate = []
+    for position, text, (mood, confidence, margin) in zip(
+            positions, texts, cascade.lexicon.analyze_moods_with_margin(texts)):
+        results[position].update(mood=mood, confidence=confidence, margin=margin, tier=CascadeAnalyzer.LEXICON)
+        if text and cascade.needs_fallback(mood, confidence, margin):
+            escalate.append((position, text))
+
+    if escalate and cascade._transformer_available():
+        try:
+            analyzed = cascade.recommender.analyze_moods([text for _, text in escalate])
+        except Exception as e:
+            logging.error(f"Transformer tier failed for a chunk: {e}")
+            analyzed = []
+        for (position, _), (mood, confidence, context) in zip(escalate, analyzed):
+            # An empty context means the transformer could not score this text
+            if context:
+                results[position].update(
+                    mood=mood, confidence=float(confidence), tier=CascadeAnalyzer.TRANSFORMER,
+                    emotion=context.get('emotion'), sentiment=context.get('sentiment'))
+    return results
+
+
+def _chunks(records, size):
+    iterator = iter(records)
+    while True:
+        chunk = list(itertools.islice(iterator, size))
+        if not chunk:
+            return
+        yield chunk
+
+
+def _ordered_results(chunks, workers, max_in_flight, init_args):
+    """
+    Score chunks and yield their results in input order.
+    At most max_in_flight chunks are queued or running at once, so memory
+    stays bounded however large the input is.
+    """
+    if workers == 0:
+        if 'cascade' not in _worker:
+            _init_worker(*init_args)
+        for chunk in chunks:
+            yield len(chunk), score_chunk(chunk)
+        return
+
+    # Fork so a recommender preloaded in this process is shared copy-on-write
+    methods = multiprocessing.get_all_start_methods()
+    context = multiprocessing.get_context('fork' if 'fork' in methods else None)
+    with ProcessPoolExecutor(workers, mp_context=context, initializer=_init_worker,
+                             initargs=init_args) as pool:
+        pending = deque()
+        for chunk in chunks:
+            pending.append((len(chunk), pool.submit(score_chunk, chunk)))
+            if len(pending) >= max_in_flight:
+                count, future = pending.popleft()
+                yield count, future.result()
+        while pending:
+            count, future = pending.popleft()
+            yield count, future.result()
+
+
+class Checkpoint:
+    """
+    Progress marker next to the output file: how many input records have
+    been written and how long the output was at that point. Written
+    atomically, so a crash leaves either the old or the new marker.
+    """
+
+    def __init__(self, path):
+        self.path = path
+
+    def load(self):
+        try:
+            with open(self.path, encoding='utf-8') as f:
+                return json.load(f)
+        except FileNotFoundError:
+            return None
+
+    def save(self, records_done, output_bytes):
+        temp_path = f"{self.path}.tmp"
+        with open(temp_path, 'w', encoding='utf-8') as f:
+            json.dump({'records_done': records_done, 'output_bytes': output_bytes}, f)
+        os.replace(temp_path, self.path)
+
+    def remove(self):
+        if os.path.exists(self.path):
+            os.unlink(self.path)
+
+
+def _writer(stream, output_format):
+    if output_format == 'csv':
+        writer = csv.DictWriter(stream, OUTPUT_FIELDS, extrasaction='ignore')
+        return writer.writeheader, writer.writerow
+    return (lambda: None), (lambda row: stream.write(json.dumps(row, ensure_ascii=False) + '\n'))
+
+
+def run(input_stream, output_stream, input_format='jsonl', output_format='jsonl', text_field='text',
+        id_field='id', workers=None, chunk_size=1000, skip=0, checkpoint=None, checkpoint_every=10,
+        progress_every=0, transformer=False, model_server=None, backend='torch', thresholds=None):
+    """
+    Score every record from input_stream into output_stream in input order.
+    workers: worker processes (all cores by default, or the autotune recommendation when
+        transformer models run in the workers; 0 scores in this process)
+    skip: records already scored by an earlier, interrupted run
+    checkpoint: optional Checkpoint updated every checkpoint_every chunks
+    transformer: escalate ambiguous records to an AIRecommender, or to the
+        model_server sidecar at that socket path when one is given
+    thresholds: CascadeAnalyzer keyword arguments deciding what is ambiguous
+    Returns the number of records scored in this run.
+    """
+    if workers is None:
+        # The tuned count balances processes against torch threads; lexicon-only
+        # workers (and ones that call a model server) are single-threaded
+        tuning = autotune.load_tuning() if transformer and not model_server else None
+        workers = tuning['workers'] if tuning and tuning.get('workers') else os.cpu_count()
+    records = itertools.islice(read_records(input_stream, input_format, text_field, id_field), skip, None)
+    write_header, write_row = _writer(output_stream, output_format)
+    if not skip:
+        write_header()
+
+    done = skip
+    start = time.monotonic()
+    init_args = (transformer, model_server, backend, thresholds or {})
+    results = _ordered_results(_chunks(records, chunk_size), workers, max(2, workers * 2), init_args)
+    for chunks_done, (count, rows) in enumerate(results, 1):
+        for row in rows:
+            write_row(row)
+        done += count
+        if checkpoint is not None and chunks_done % checkpoint_every == 0:
+            output_stream.flush()
+            checkpoint.save(done, output_stream.tell())
+        if progress_every and chunks_done % progress_every == 0:
+            rate = (done - skip) / (time.monotonic() - start)
+            logging.info(f"{done} records scored ({rate:,.0f}/s)")
+
+    output_stream.flush()
+    return done - skip
+
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description="Re-score stored chat messages with MoodAnalyzer")
+    parser.add_argument('input', help="JSONL or CSV file ('-' for stdin)")
+    parser.add_argument('--output', '-o', default='-', help="output file ('-' for stdout)")
+    parser.add_argument('--input-format', choices=INPUT_FORMATS)
+    parser.add_argument('--output-format', choices=INPUT_FORMATS)
+    parser.add_argument('--text-field', default='text')
+    parser.add_argument('--id-field', default='id')
+    parser.add_argument('--workers', type=int, default=None, help="worker processes (0 scores in-process)")
+    parser.add_argument('--chunk-size', type=int, default=1000)
+    parser.add_argument('--resume', action='store_true', help="continue from the output's checkpoint")
+    parser.add_argument('--checkpoint-every', type=int, default=10, help="chunks between checkpoints")
+    parser.add_argument('--transformer', action='store_true',
+                        help="send ambiguous messages to the transformer tier")
+    parser.add_argument('--model-server', help="Unix socket of a model_server sidecar to use for that tier")
+    parser.add_argument('--backend', default='torch', help="inference backend for AIRecommender")
+    parser.add_argument('--confidence-threshold', type=float, default=0.8)
+    parser.add_argument('--min-margin', type=float, default=0.2)
+    args = parser.parse_args(argv)
+
+    input_format = args.input_format or detect_format(args.input)
+    output_format = args.output_format or detect_format(args.output)
+    thresholds = {'confidence_threshold': args.confidence_threshold, 'min_margin': args.min_margin}
+
+    if args.transformer and args.model_server:
+        # Fail here rather than in every worker when the handshake key is missing
+        from model_server import ModelServerError, server_authkey
+        try:
+            server_authkey()
+        except ModelServerError as e:
+            parser.error(str(e))
+    elif args.transformer:
+        # Load the models once here; forked workers share them copy-on-write
+        from ai_recommender import AIRecommender
+        from model_server import preload_for_fork
+        _worker['recommender'] = AIRecommender(backend=args.backend)
+        logging.info(f"Model warm-up: {preload_for_fork(_worker['recommender'])}")
+
+    checkpoint, skip = None, 0
+    if args.output == '-':
+        if args.resume:
+            parser.error("--resume needs an output file")
+        output_stream = sys.stdout
+    else:
+        checkpoint = Checkpoint(f"{args.output}.checkpoint")
+        state = checkpoint.load() if args.resume else None
+        output_stream = open(args.output, 'r+' if state else 'w', encoding='utf-8', newline='')
+        if state:
+            # Drop anything written after the last checkpoint; it will be rescored
+            skip = state['records_done']
+            output_stream.seek(state['output_bytes'])
+            output_stream.truncate()
+            logging.info(f"Resuming after {skip} records")
+
+    input_stream = (sys.stdin if args.input == '-'
+                    else open(args.input, encoding='utf-8', newline='' if input_format == 'csv' else None))
+    try:
+        start = time.monotonic()
+        scored = run(input_stream, output_stream, input_format, output_format, args.text_field,
+                     args.id_field, args.workers, args.chunk_size, skip, checkpoint,
+                     args.checkpoint_every, progress_every=100, transformer=args.transformer,
+                     model_server=args.model_server, backend=args.backend, thresholds=thresholds)
+        elapsed = time.monotonic() - start
+        logging.info(f"Scored {scored} records in {elapsed:.1f}s ({scored / elapsed if elapsed else 0:,.0f}/s)")
+    finally:
+        if input_stream is not sys.stdin:
+            input_stream.close()
+        if output_stream is not sys.stdout:
+            output_stream.close()
+
+    if checkpoint is not None:
+        checkpoint.remove()
+    return 0
+
+
+if __name__ == '__main__':
+    logging.basicConfig(level=logging.INFO)
+    sys.exit(main())
@@ -0,0 +1,141 @@
+import os
+import tempfile
+import threading
+from collections import OrderedDict
+from contextlib import contextmanager
+
+# Where rebuildable artifacts live by default: compiled lexicon, bundle, tuning, ONNX exports
+CACHE_DIR = os.path.join(os.path.expanduser('~'), '.cache', 'moodsync')
+
+
+def _read_umask():
+    umask = os.umask(0)
+    os.umask(umask)
+    return umask
+
+
+# Read once at import, while no other thread can be creating files
+_UMASK = _read_umask()
+
+
+def shared_mode(mode=0o644):
+    """mode less the process umask: artifacts must be readable by workers running as other users"""
+    return mode & ~_UMASK
+
+
+@contextmanager
+def atomic_write(path, mode='wb', encoding=None):
+    """
+    Write path through a temporary file in the same directory. On success the
+    file is synced, given shared_mode() permissions (mkstemp creates it 0600)
+    and moved into place with os.replace, so readers see either the old or the
+    new file, never a partial one; on failure the temporary file is removed.
+    """
+    directory = os.path.dirname(os.path.abspath(path))
+    os.makedirs(directory, exist_ok=True)
+    handle, temp_path = tempfile.mkstemp(dir=directory, suffix='.tmp')
+    try:
+        with os.fdopen(handle, mode, encoding=encoding) as f:
+            yield f
+            f.flush()
+            os.fsync(f.fileno())
+        os.chmod(temp_path, shared_mode())
+        os.replace(temp_path, path)
+    except BaseException:
+        if os.path.exists(temp_path):
+            os.unlink(temp_path)
+        raise
+
+
+def normalize_cache_key(text):
+    """Collapse whitespace so equivalent messages share one cache entry"""
+    return ' '.join(text.split())
+
+
+class LRUCache:
+    """
+    A size-bounded, thread-safe least-recently-used cache.
+    Tracks hits, misses and evictions so callers can report cache efficiency.
+    A maxsize of 0 disables storage while still counting lookups.
+    """
+
+    _MISSING = object()
+
+    def __init__(self, maxsize=1024):
+        if maxsize < 0:
+            raise ValueError("maxsize must be >= 0")
+        self.maxsize = maxsize
+        self._data = OrderedDict()
+        self._lock = threading.Lock()
+        self.hits = 0
+        self.misses = 0
+        self.evictions = 0
+
+    def get(self, key, default=None):
+        """Return the cached value for key, or default on a miss"""
+        with self._lock:
+            value = self._data.get(key, self._MISSING)
+            if value is self._MISSING:
+                self.misses += 1
+                return default
+            self._data.move_to_end(key)
+            self.hits += 1
+            return value
+
+    def put(self, key, value):
+        """Store value under key, evicting the least recently used entries"""
+        if self.maxsize == 0:
+            return
+        with self._lock:
+            self._data[key] = value
+            self._data.move_to_end(key)
+            while len(self._data) > self.maxsize:
+                self._data.popitem(last=False)
+                self.evictions += 1
+
+    def pop(self, key, default=None):
+        """Remove key and return its value, or default if it was not cached"""
+        with self._lock:
+            return self._data.pop(key, default)
+
+    def keys(self):
+        """Snapshot of the cached keys, least recently used first"""
+        with self._lock:
+            return list(self._data)
+
+    def get_or_compute(self, key, compute):
+        """Return the cached value for key, computing and storing it on a miss"""
+        value = self.get(key, self._MISSING)
+        if value is self._MISSING:
+            value = compute()
+            self.put(key, value)
+        return value
+
+    def clear(self):
+        """Drop all entries and reset the counters"""
+        with self._lock:
+            self._data.clear()
+            self.hits = 0
+            self.misses = 0
+            self.evictions = 0
+
+    def stats(self):
+        """Return a snapshot of the cache counters"""
+        with self._lock:
+            lookups = self.hits + self.misses
+            return {
+                'hits': self.hits,
+                'misses': self.misses,
+                'evictions': self.evictions,
+                'size': len(self._data),
+                'maxsize': self.maxsize,
+                'hit_rate': self.hits / lookups if lookups else 0.0
+            }
+
+    def __len__(self):
+        with self._lock:
+            return len(self._data)
+
+    def __contains__(self, key):
+        with self._lock:
+            return key in self._data
@@ -0,0 +1,186 @@
+import logging
+import threading
+import time
+from concurrent.futures import Future
+
+from caching import LRUCache
+
+
+def canonical_keywords(keywords):
+    """Order-independent, case-insensitive form of a keyword list"""
+    return tuple(sorted({keyword.strip().lower() for keyword in keywords if keyword and keyword.strip()}))
+
+
+class FakeSearchBackend:
+    """
+    Local stand-in for the YouTube search API.
+    Returns deterministic results, counts upstream calls and can simulate
+    latency or failures, so the fetch layer can be exercised offline.
+    """
+
+    def __init__(self, latency=0.0, fail=False):
+        self.latency = latency
+        self.fail = fail
+        self.calls = 0
+        self._lock = threading.Lock()
+
+    def search(self, mood, content_type, keywords, max_results):
+        with self._lock:
+            self.calls += 1
+            call = self.calls
+        if self.latency:
+            time.sleep(self.latency)
+        if self.fail:
+            raise RuntimeError("search backend unavailable")
+        query = ' '.join(keywords)
+        return [
+            {
+                'id': f"{mood}-{content_type}-{i}",
+                'title': f"{query} #{i}",
+                'type': content_type,
+                'fetch': call
+            }
+            for i in range(max_results)
+        ]
+
+
+class YouTubeSearchBackend:
+    """Search backend backed by the YouTube Data API (google-api-python-client)"""
+
+    def __init__(self, api_key):
+        from googleapiclient.discovery import build
+        self._youtube = build('youtube', 'v3', developerKey=api_key, cache_discovery=False)
+
+    def search(self, mood, content_type, keywords, max_results):
+        query = ' '.join(list(keywords) + [content_type])
+        response = self._youtube.search().list(
+            q=query, part='snippet', type='video', maxResults=max_results
+        ).execute()
+        return [
+            {
+                'id': item['id']['videoId'],
+                'title': item['snippet']['title'],
+                'description': item['snippet'].get('description', ''),
+                'thumbnail': item['snippet'].get('thumbnails', {}).get('medium', {}).get('url'),
+                'type': content_type
+            }
+            for item in response.get('items', [])
+        ]
+
+
+class ContentFetcher:
+    """
+    Caching front for content searches keyed on (mood, content type, canonical keywords).
+    Fresh entries are served directly; entries past their TTL but within the
+    stale window are served immediately while one background refresh runs
+    (stale-while-revalidate); concurrent misses for the same key share a single
+    upstream call. If an upstream call fails, stale data is served when available.
+    """
+
+    def __init__(self, backend, ttl=300.0, stale_ttl=3600.0, max_entries=1024, clock=time.monotonic):
+        """
+        ttl: seconds an entry is fresh
+        stale_ttl: extra seconds an expired entry may still be served while refreshing
+        clock: time source, injectable for tests
+        """
+        self.backend = backend
+        self.ttl = ttl
+        self.stale_ttl = stale_ttl
+        self.clock = clock
+        self._entries = LRUCache(max_entries)
+        self._lock = threading.Lock()
+        self._in_flight = {}
+        self._counters = {
+            'hits': 0, 'stale_hits': 0, 'misses': 0, 'coalesced': 0,
+            'upstream_calls': 0, 'refreshes': 0, 'errors': 0
+        }
+
+    def _count(self, name):
+        with self._lock:
+            self._counters[name] += 1
+
+    def fetch(self, mood, content_type, keywords, max_results=10):
+        """Return search results for the request, from cache when possible"""
+        keywords = canonical_keywords(keywords)
+        key = (mood, content_type, keywords, max_results)
+        entry = self._entries.get(key)
+        now = self.clock()
+
+        if entry is not None:
+            fetched_at, results = entry
+            age = now - fetched_at
+            if age < self.ttl:
+                self._count('hits')
+                return results
+            if age < self.ttl + self.stale_ttl:
+                self._count('stale_hits')
+                self._refresh_in_background(key)
+                return results
+
+        self._count('misses')
+        return self._load(key, stale=entry[1] if entry is not None else None)
+
+    def _load(self, key, stale=None):
+        """Fetch key upstream, sharing the call with concurrent requests for the same key"""
+        with self._lock:
+            future = self._in_flight.get(key)
+            owner = future is None
+            if owner:
+                future = Future()
+                self._in_flight[key] = future
+            else:
+                self._counters['coalesced'] += 1
+
+        if owner:
+            self._call_upstream(key, future)
+
+        try:
+            return future.result()
+        except Exception:
+            if stale is not None:
+                return stale
+            raise
+
+    def _call_upstream(self, key, future):
+        mood, content_type, keywords, max_results = key
+        self._count('upstream_calls')
+        try:
+            results = self.backend.search(mood, content_type, list(keywords), max_results)
+        except Exception as e:
+            self._count('errors')
+            logging.error(f"Content search failed for {mood}/{content_type}: {e}")
+            future.set_exception(e)
+        else:
+            self._entries.put(key, (self.clock(), results))
+            future.set_result(results)
+        finally:
+            with self._lock:
+                self._in_flight.pop(key, None)
+
+    def _refresh_in_background(self, key):
+        """Start one refresh for key unless one is already running"""
+        with self._lock:
+            if key in self._in_flight:
+                return
+            future = Future()
+            self._in_flight[key] = future
+            self._counters['refreshes'] += 1
+
+        threading.Thread(target=self._call_upstream, args=(key, future), daemon=True).start()
+
+    def invalidate(self, mood=None):
+        """Drop cached results, optionally only for one mood"""
+        if mood is None:
+            self._entries.clear()
+            return
+        for key in self._entries.keys():
+            if key[0] == mood:
+                self._entries.pop(key)
+
+    def stats(self):
+        """Get cache and upstream-call counters"""
+        with self._lock:
+            stats = dict(self._counters)
+            stats['in_flight'] = len(self._in_flight)
+        stats['entries'] = len(self._entries)
+        return stats
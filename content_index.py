@@ -0,0 +1,320 @@
+import threading
+
+import numpy as np
+
+# Search strategies supported by ContentIndex
+INDEX_BACKENDS = ('exact', 'ivf')
+
+
+def _normalize(vectors):
+    vectors = np.atleast_2d(np.asarray(vectors, dtype=np.float32))
+    norms = np.linalg.norm(vectors, axis=1, keepdims=True)
+    return np.divide(vectors, norms, out=np.zeros_like(vectors), where=norms > 0)
+
+
+class ContentIndex:
+    """
+    Catalog of content items with precomputed embeddings, answering top-k
+    cosine-similarity queries.
+    The 'exact' backend scores every item with one matrix product; the 'ivf'
+    backend clusters items with k-means and only scores the n_probe clusters
+    closest to the query, trading recall for speed. Items can be added and
+    removed at any time.
+    """
+
+    def __init__(self, dim=384, backend='exact', n_lists=None, n_probe=8, train_threshold=1024,
+                 retrain_factor=4):
+        """
+        n_lists: number of IVF clusters (defaults to ~sqrt of the catalog size at training)
+        n_probe: clusters scanned per query; higher means better recall
+        train_threshold: catalog size at which the IVF backend trains itself
+        retrain_factor: retrain once the catalog has grown to this many times the
+        size it was trained at (None or 0 to only train once)
+        """
+        if backend not in INDEX_BACKENDS:
+            raise ValueError(f"Unknown index backend '{backend}', expected one of {INDEX_BACKENDS}")
+        self.dim = dim
+        self.backend = backend
+        self.n_lists = n_lists
+        self.n_probe = n_probe
+        self.train_threshold = train_threshold
+        self.retrain_factor = retrain_factor
+
+        self._lock = threading.RLock()
+        self._vectors = np.zeros((0, dim), dtype=np.float32)
+        self._size = 0
+        self._ids = []
+        self._types = []
+        self._metadata = []
+        self._rows = {}
+
+        # Content types as small integer codes so filtering is a vector comparison
+        self._type_codes = {}
+        self._type_array = np.zeros(0, dtype=np.int32)
+
+        # IVF state: centroids, row -> cluster, and per-cluster row lists
+        self._centroids = None
+        self._trained_size = 0
+        self._assign = np.zeros(0, dtype=np.int32)
+        self._lists = []
+        self._list_cache = {}
+
+    def __len__(self):
+        return self._size
+
+    def __contains__(self, item_id):
+        return item_id in self._rows
+
+    @property
+    def trained(self):
+        return self._centroids is not None
+
+    def _reserve(self, extra):
+        """Grow the backing arrays geometrically so appends stay amortized O(1)"""
+        needed = self._size + extra
+        if needed <= len(self._vectors):
+            return
+        capacity = max(needed, 2 * len(self._vectors), 64)
+        vectors = np.zeros((capacity, self.dim), dtype=np.float32)
+        vectors[:self._size] = self._vectors[:self._size]
+        assign = np.full(capacity, -1, dtype=np.int32)
+        assign[:self._size] = self._assign[:self._size]
+        type_array = np.zeros(capacity, dtype=np.int32)
+        type_array[:self._size] = self._type_array[:self._size]
+        self._vectors, self._assign, self._type_array = vectors, assign, type_array
+
+    def add(self, item_id, embedding, content_type=None, metadata=None):
+        """Add or replace one item"""
+        self.add_many([(item_id, embedding, content_type, metadata)])
+
+    def add_many(self, items, train=True):
+        """
+        Add or replace items given as (item_id, embedding, content_type, metadata) tuples.
+        With train=False the IVF backend does not (re)train itself; bulk loaders
+        add everything first and call train() once at the end.
+        """
+        # A repeated id keeps only its last entry, as separate add() calls would
+        items = list({item[0]: item for item in items}.values())
+        if not items:
+            return
+        vectors = _normalize([embedding for _, embedding, _, _ in items])
+        if vectors.shape[1] != self.dim:
+            raise ValueError(f"Expected embeddings of size {self.dim}, got {vectors.shape[1]}")
+
+        with self._lock:
+            for item_id, _, _, _ in items:
+                if item_id in self._rows:
+                    self._remove_row(self._rows[item_id])
+
+            self._reserve(len(items))
+            start = self._size
+            self._vectors[start:start + len(items)] = vectors
+            for offset, (item_id, _, content_type, metadata) in enumerate(items):
+                self._rows[item_id] = start + offset
+                self._ids.append(item_id)
+                self._types.append(content_type)
+                self._type_array[start + offset] = self._type_codes.setdefault(
+                    content_type, len(self._type_codes))
+                self._metadata.append(metadata or {})
+            self._size += len(items)
+
+            if train and self.needs_training():
+                self.train()
+            elif self.trained:
+                rows = np.arange(start, self._size)
+                self._assign_rows(rows, self._nearest_lists(vectors, 1)[:, 0])
+
+    def needs_training(self):
+        """
+        True when the IVF backend has reached train_threshold without being
+        trained, or has grown past retrain_factor times its trained size (the
+        clusters, and the default sqrt-sized n_lists, no longer fit the catalog).
+        """
+        if self.backend != 'ivf' or self._size < self.train_threshold:
+            return False
+        if not self.trained:
+            return True
+        return bool(self.retrain_factor) and self._size >= self._trained_size * self.retrain_factor
+
+    def remove(self, item_id):
+        """Remove an item; returns False if it was not in the index"""
+        with self._lock:
+            row = self._rows.get(item_id)
+            if row is None:
+                return False
+            self._remove_row(row)
+            return True
+
+    def _remove_row(self, row):
+        """Swap-remove: move the last row into the hole to keep storage contiguous"""
+        last = self._size - 1
+        removed_id = self._ids[row]
+
+        if self.trained:
+            self._lists[self._assign[row]].remove(row)
+            self._list_cache.pop(self._assign[row], None)
+
+        if row != last:
+            self._vectors[row] = self._vectors[last]
+            self._ids[row] = self._ids[last]
+            self._types[row] = self._types[last]
+            self._type_array[row] = self._type_array[last]
+            self._metadata[row] = self._metadata[last]
+            self._rows[self._ids[row]] = row
+            if self.trained:
+                cluster = self._assign[last]
+                members = self._lists[cluster]
+                members[members.index(last)] = row
+                self._assign[row] = cluster
+                self._list_cache.pop(cluster, None)
+
+        del self._rows[removed_id]
+        self._ids.pop()
+        self._types.pop()
+        self._metadata.pop()
+        self._assign[last] = -1
+        self._size -= 1
+
+    def train(self, n_lists=None, iterations=10, sample_size=65536, seed=0):
+        """
+        Cluster the current items with spherical k-means and build the IVF lists.
+        Can be called again to rebalance after the catalog has changed a lot.
+        """
+        with self._lock:
+            if self._size == 0:
+                raise ValueError("Cannot train an empty index")
+            vectors = self._vectors[:self._size]
+            n_lists = n_lists or self.n_lists or max(1, int(np.sqrt(self._size)))
+            n_lists = min(n_lists, self._size)
+
+            rng = np.random.default_rng(seed)
+            sample = vectors
+            if self._size > sample_size:
+                sample = vectors[rng.choice(self._size, sample_size, replace=False)]
+
+            centroids = sample[rng.choice(len(sample), n_lists, replace=False)].copy()
+            for _ in range(iterations):
+                labels = np.argmax(sample @ centroids.T, axis=1)
+                sums = np.zeros_like(centroids)
+                np.add.at(sums, labels, sample)
+                empty = np.bincount(labels, minlength=n_lists) == 0
+                # Re-seed empty clusters with random points so every list is used
+                sums[empty] = sample[rng.choice(len(sample), int(empty.sum()))]
+                centroids = _normalize(sums)
+
+            self._centroids = centroids
+            self._trained_size = self._size
+            self._lists = [[] for _ in range(n_lists)]
+            self._list_cache = {}
+            self._assign_rows(np.arange(self._size), self._nearest_lists(vectors, 1)[:, 0])
+
+    def _nearest_lists(self, vectors, count):
+        """Indexes of the count closest centroids for each vector"""
+        scores = vectors @ self._centroids.T
+        count = min(count, len(self._centroids))
+        if count == len(self._centroids):
+            return np.argsort(-scores, axis=1)
+        return np.argpartition(-scores, count - 1, axis=1)[:, :count]
+
+    def _assign_rows(self, rows, clusters):
+        self._assign[rows] = clusters
+        for row, cluster in zip(rows.tolist(), clusters.tolist()):
+            self._lists[cluster].append(row)
+            self._list_cache.pop(cluster, None)
+
+    def _list_rows(self, cluster):
+        rows = self._list_cache.get(cluster)
+        if rows is None:
+            rows = np.array(self._lists[cluster], dtype=np.int64)
+            self._list_cache[cluster] = rows
+        return rows
+
+    def search(self, query, k=10, content_type=None, n_probe=None, exact=None):
+        """
+        Top-k items for a query embedding, best first.
+        Returns a list of dicts with 'id', 'score', 'type' and 'metadata'.
+        content_type restricts results to items of that type; exact=True forces
+        a full scan even on an IVF index.
+        """
+        query = _normalize(query)[0]
+        with self._lock:
+            if self._size == 0 or k <= 0:
+                return []
+
+            use_ivf = self.backend == 'ivf' and self.trained and not exact
+            if use_ivf:
+                probes = self._nearest_lists(query[None, :], n_probe or self.n_probe)[0]
+                rows = np.concatenate([self._list_rows(cluster) for cluster in probes])
+            else:
+                rows = None
+
+            if content_type is not None:
+                code = self._type_codes.get(content_type)
+                if code is None:
+                    return []
+                candidates = rows if rows is not None else np.arange(self._size)
+                rows = candidates[self._type_array[candidates] == code]
+
+            if rows is None:
+                scores = self._vectors[:self._size] @ query
+                rows = np.arange(self._size)
+            else:
+                scores = self._vectors[rows] @ query
+
+            if len(rows) == 0:
+                return []
+            if len(rows) > k:
+                top = np.argpartition(-scores, k - 1)[:k]
+            else:
+                top = np.arange(len(rows))
+            top = top[np.argsort(-scores[top], kind='stable')]
+
+            return [
+                {
+                    'id': self._ids[row],
+                    'score': float(scores[position]),
+                    'type': self._types[row],
+                    'metadata': self._metadata[row]
+                }
+                for position, row in zip(top.tolist(), rows[top].tolist())
+            ]
+
+    def measure_recall(self, queries, k=10, n_probe=None):
+        """
+        Fraction of the exact top-k that the IVF search returns, averaged over queries.
+        Use it to pick n_probe for a target recall.
+        """
+        hits = 0
+        total = 0
+        for query in np.atleast_2d(queries):
+            truth = {hit['id'] for hit in self.search(query, k, exact=True)}
+            found = {hit['id'] for hit in self.search(query, k, n_probe=n_probe)}
+            hits += len(truth & found)
+            total += len(truth)
+        return hits / total if total else 1.0
+
+
+def content_text(item):
+    """Text used to embed a catalog item: title, description and tags"""
+    return ' '.join([item.get('title', ''), item.get('description', ''), ' '.join(item.get('tags', []))]).strip()
+
+
+def build_content_index(recommender, items, batch_size=256, **index_options):
+    """
+    Embed catalog items with the recommender's sentence transformer and index them.
+    items are dicts with at least 'id', plus 'type', 'title', 'description' and 'tags'.
+    An IVF index is trained once, on the whole catalog, after every item is added.
+    """
+    index = ContentIndex(**index_options)
+    items = list(items)
+    for start in range(0, len(items), batch_size):
+        chunk = items[start:start + batch_size]
+        embeddings = recommender._get_embeddings([content_text(item) for item in chunk])
+        index.add_many(
+            ((item['id'], embedding, item.get('type'), item)
+             for item, embedding in zip(chunk, embeddings)),
+            train=False
+        )
+    if index.needs_training():
+        index.train()
+    return index
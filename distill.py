@@ -0,0 +1,282 @@
+import argparse
+import json
+import logging
+import os
+import re
+import sys
+import time
+import zlib
+
+import numpy as np
+
+from moodanalyser import split_emojis
+
+# Where MoodAnalyzer(engine='distilled') looks for a model when none is passed in
+DISTILLED_MODEL_ENV = 'MOODSYNC_DISTILLED_MODEL'
+MODEL_FORMAT_VERSION = 1
+
+WORD_PATTERN = re.compile(r"[a-z0-9']+")
+
+
+def extract_features(text):
+    """
+    Feature strings for one message: word unigrams and bigrams of the
+    emoji-free lowercased text, each emoji cluster, and a bias feature.
+    Bigrams let the model learn negations such as "not happy".
+    """
+    emojis, clean_text = split_emojis(text)
+    words = WORD_PATTERN.findall(clean_text.lower())
+    features = ['bias']
+    features.extend('w:' + word for word in words)
+    features.extend(f'b:{first} {second}' for first, second in zip(words, words[1:]))
+    features.extend('e:' + emoji for emoji in emojis)
+    return features
+
+
+def hash_features(text, n_features):
+    """Unique hashed feature ids for text and the per-feature value (rows are L2-normalized)"""
+    ids = np.unique(np.fromiter((zlib.crc32(feature.encode('utf-8')) % n_features
+                                 for feature in extract_features(text)), dtype=np.int64))
+    return ids, 1.0 / np.sqrt(len(ids))
+
+
+def _sparse_batch(texts, n_features):
+    """Flattened feature ids, values and row starts for a list of texts"""
+    ids, values, starts = [], [], []
+    offset = 0
+    for text in texts:
+        row_ids, value = hash_features(text, n_features)
+        starts.append(offset)
+        ids.append(row_ids)
+        values.append(np.full(len(row_ids), value, dtype=np.float32))
+        offset += len(row_ids)
+    return np.concatenate(ids), np.concatenate(values), np.array(starts)
+
+
+def _softmax(logits):
+    logits = logits - logits.max(axis=1, keepdims=True)
+    np.exp(logits, out=logits)
+    logits /= logits.sum(axis=1, keepdims=True)
+    return logits
+
+
+class DistilledMoodModel:
+    """
+    Linear mood classifier over hashed n-gram and emoji features.
+    Scoring a message is a hash per feature plus a sum of weight rows, so it
+    runs at lexicon speed while imitating the transformer teacher.
+    """
+
+    def __init__(self, weights, bias, labels, metadata=None):
+        self.weights = np.ascontiguousarray(weights, dtype=np.float32)
+        self.bias = np.asarray(bias, dtype=np.float32)
+        self.labels = list(labels)
+        self.n_features = self.weights.shape[0]
+        self.metadata = metadata or {}
+
+    @classmethod
+    def load(cls, path):
+        with np.load(path, allow_pickle=False) as data:
+            version = int(data['version'])
+            if version != MODEL_FORMAT_VERSION:
+                raise ValueError(f"Unsupported distilled model version {version} in {path}")
+            metadata = json.loads(str(data['metadata']))
+            return cls(data['weights'], data['bias'], [str(label) for label in data['labels']], metadata)
+
+    def save(self, path):
+        """Write the model as a compressed .npz with float16 weights"""
+        with open(path, 'wb') as f:
+            np.savez_compressed(
+                f,
+                version=np.array(MODEL_FORMAT_VERSION),
+                weights=self.weights.astype(np.float16),
+                bias=self.bias,
+                labels=np.array(self.labels),
+                metadata=np.array(json.dumps(self.metadata))
+            )
+
+    def predict_proba(self, texts):
+        """(texts x labels) probabilities"""
+        ids, values, starts = _sparse_batch(texts, self.n_features)
+        logits = np.add.reduceat(self.weights[ids] * values[:, None], starts, axis=0) + self.bias
+        return _softmax(logits)
+
+    def predict(self, texts):
+        """(label, probability) per text"""
+        probabilities = self.predict_proba(texts)
+        best = probabilities.argmax(axis=1)
+        return [(self.labels[i], float(p[i])) for i, p in zip(best, probabilities)]
+
+
+def train(texts, targets, labels, n_features=2 ** 16, epochs=8, batch_size=256, learning_rate=0.5,
+          seed=0):
+    """
+    Fit a DistilledMoodModel with mini-batch Adagrad on softmax cross-entropy.
+    targets is a (texts x labels) array of teacher probabilities (one-hot for hard labels).
+    """
+    rng = np.random.default_rng(seed)
+    targets = np.asarray(targets, dtype=np.float32)
+    weights = np.zeros((n_features, len(labels)), dtype=np.float32)
+    bias = np.zeros(len(labels), dtype=np.float32)
+    weight_history = np.full_like(weights, 1e-8)
+    bias_history = np.full_like(bias, 1e-8)
+
+    # Hash every text once; batches slice into these rows
+    features = [hash_features(text, n_features) for text in texts]
+
+    for _ in range(epochs):
+        order = rng.permutation(len(texts))
+        for start in range(0, len(texts), batch_size):
+            batch = order[start:start + batch_size]
+            ids = np.concatenate([features[i][0] for i in batch])
+            lengths = np.array([len(features[i][0]) for i in batch])
+            values = np.repeat([features[i][1] for i in batch], lengths).astype(np.float32)
+            starts = np.concatenate([[0], np.cumsum(lengths)[:-1]])
+
+            logits = np.add.reduceat(weights[ids] * values[:, None], starts, axis=0) + bias
+            error = (_softmax(logits) - targets[batch]) / len(batch)
+
+            # Sum gradients of feature ids shared by several rows before the update
+            unique_ids, inverse = np.unique(ids, return_inverse=True)
+            gradient = np.zeros((len(unique_ids), len(labels)), dtype=np.float32)
+            np.add.at(gradient, inverse, np.repeat(error, lengths, axis=0) * values[:, None])
+            weight_history[unique_ids] += gradient ** 2
+            weights[unique_ids] -= learning_rate * gradient / np.sqrt(weight_history[unique_ids])
+
+            bias_gradient = error.sum(axis=0)
+            bias_history += bias_gradient ** 2
+            bias -= learning_rate * bias_gradient / np.sqrt(bias_history)
+
+    return DistilledMoodModel(weights, bias, labels, {
+        'n_features': n_features, 'epochs': epochs, 'training_examples': len(texts)})
+
+
+def label_corpus(texts, teacher, batch_size=32, temperature=0.05):
+    """
+    Label texts with the teacher's analyze_moods.
+    Returns (examples, seconds per message) where each example holds the
+    text, the teacher's mood and its softened mood distribution; texts the
+    teacher could not score are dropped.
+    """
+    examples = []
+    start = time.perf_counter()
+    for offset in range(0, len(texts), batch_size):
+        batch = texts[offset:offset + batch_size]
+        for text, (mood, _, context) in zip(batch, teacher.analyze_moods(batch)):
+            scores = context.get('mood_scores') if context else None
+            if not scores:
+                continue
+            similarities = np.array(list(scores.values()), dtype=np.float32)
+            soft = _softmax((similarities / temperature)[None, :])[0]
+            examples.append({'text': text, 'mood': mood,
+                             'scores': dict(zip(scores, (round(float(p), 6) for p in soft)))})
+    seconds = time.perf_counter() - start
+    return examples, seconds / len(texts) if texts else 0.0
+
+
+def _latency(function, texts):
+    start = time.perf_counter()
+    for text in texts:
+        function(text)
+    return (time.perf_counter() - start) / len(texts) if texts else 0.0
+
+
+def evaluate(model, examples, lexicon=None):
+    """Top-1 agreement with the teacher and per-message latency, next to the lexicon analyzer"""
+    texts = [example['text'] for example in examples]
+    predicted = [mood for mood, _ in model.predict(texts)]
+    report = {
+        'examples': len(examples),
+        'distilled_agreement': float(np.mean([p == e['mood'] for p, e in zip(predicted, examples)])),
+        'distilled_ms_per_message': 1000.0 * _latency(lambda text: model.predict([text]), texts)
+    }
+    if lexicon is not None:
+        lexicon_moods = [lexicon.analyze_mood(text)[0] for text in texts]
+        report['lexicon_agreement'] = float(np.mean([m == e['mood'] for m, e in zip(lexicon_moods, examples)]))
+        lexicon.clear_caches()
+        report['lexicon_ms_per_message'] = 1000.0 * _latency(lexicon.analyze_mood, texts)
+    return report
+
+
+def _read_texts(path):
+    from bulk_score import detect_format, read_records
+
+    with open(path, encoding='utf-8', newline='') as f:
+        if path.endswith('.txt'):
+            return [line.strip() for line in f if line.strip()]
+        return [text for _, text, error in read_records(f, detect_format(path)) if text and not error]
+
+
+def _read_examples(path):
+    with open(path, encoding='utf-8') as f:
+        return [json.loads(line) for line in f if line.strip()]
+
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description="Distill AIRecommender mood labels into a small linear model")
+    commands = parser.add_subparsers(dest='command', required=True)
+
+    label = commands.add_parser('label', help="label a corpus with the transformer teacher")
+    label.add_argument('input', help=".txt (one message per line), .jsonl or .csv corpus")
+    label.add_argument('--output', '-o', required=True, help="labelled examples (JSONL)")
+    label.add_argument('--backend', default='torch')
+    label.add_argument('--batch-size', type=int, default=32)
+    label.add_argument('--offline', action='store_true',
+                       help="use benchmark's stub teacher (checks the pipeline, not real quality)")
+
+    fit = commands.add_parser('train', help="train and evaluate a model on labelled examples")
+    fit.add_argument('examples')
+    fit.add_argument('--output', '-o', required=True, help="model file (.npz)")
+    fit.add_argument('--n-features', type=int, default=2 ** 16)
+    fit.add_argument('--epochs', type=int, default=8)
+    fit.add_argument('--holdout', type=float, default=0.1, help="share of examples kept for evaluation")
+    fit.add_argument('--hard-labels', action='store_true', help="train on the teacher's top mood only")
+
+    check = commands.add_parser('evaluate', help="report agreement and latency of a saved model")
+    check.add_argument('model')
+    check.add_argument('examples')
+
+    args = parser.parse_args(argv)
+
+    if args.command == 'label':
+        if args.offline:
+            from benchmark import OfflineRecommender as Teacher
+        else:
+            from ai_recommender import AIRecommender as Teacher
+        examples, seconds = label_corpus(_read_texts(args.input), Teacher(backend=args.backend), args.batch_size)
+        with open(args.output, 'w', encoding='utf-8') as f:
+            for example in examples:
+                f.write(json.dumps(example, ensure_ascii=False) + '\n')
+        print(json.dumps({'examples': len(examples), 'teacher_ms_per_message': seconds * 1000.0}))
+        return 0
+
+    from moodanalyser import MoodAnalyzer
+
+    examples = _read_examples(args.examples)
+    if args.command == 'evaluate':
+        report = evaluate(DistilledMoodModel.load(args.model), examples, MoodAnalyzer())
+        print(json.dumps(report, indent=2))
+        return 0
+
+    labels = sorted({mood for example in examples for mood in example['scores']})
+    order = np.random.default_rng(0).permutation(len(examples))
+    split = int(len(examples) * (1 - args.holdout))
+    training = [examples[i] for i in order[:split]]
+    held_out = [examples[i] for i in order[split:]] or training
+
+    if args.hard_labels:
+        targets = np.eye(len(labels), dtype=np.float32)[[labels.index(e['mood']) for e in training]]
+    else:
+        targets = np.array([[e['scores'].get(label, 0.0) for label in labels] for e in training])
+    model = train([e['text'] for e in training], targets, labels, args.n_features, args.epochs)
+    model.save(args.output)
+
+    report = evaluate(model, held_out, MoodAnalyzer())
+    report['model_bytes'] = os.path.getsize(args.output)
+    print(json.dumps(report, indent=2))
+    return 0
+
+
+if __name__ == '__main__':
+    logging.basicConfig(level=logging.INFO)
+    sys.exit(main())
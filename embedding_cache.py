@@ -0,0 +1,270 @@
+import hashlib
+import logging
+import os
+import re
+import threading
+import time
+
+import numpy as np
+
+try:
+    import fcntl
+except ImportError:  # Windows: concurrent writers are not serialized
+    fcntl = None
+
+from caching import LRUCache, atomic_write
+
+
+def text_key(text):
+    """Stable 64-bit key for a piece of text"""
+    return int.from_bytes(hashlib.blake2b(text.encode('utf-8'), digest_size=8).digest(), 'little')
+
+
+class EmbeddingStore:
+    """
+    Persistent embedding store for one encoder model.
+    Entries live in a single .npy file of (key, vector) records sorted by key,
+    opened memory-mapped so several worker processes share the same pages.
+    Writers merge new entries and atomically replace the file under an
+    exclusive lock, so concurrent writers do not drop each other's entries;
+    readers pick the new file up on reload().
+    At most max_pending vectors wait for a flush; older ones are dropped first.
+    """
+
+    def __init__(self, directory, model_name, dim, max_pending=4096):
+        self.directory = directory
+        self.model_name = model_name
+        self.dim = dim
+        self.max_pending = max_pending
+        self.dtype = np.dtype([('key', '<u8'), ('vector', '<f4', (dim,))])
+
+        # One file per model so different encoders never mix vectors
+        slug = re.sub(r'[^A-Za-z0-9_.-]+', '_', model_name)
+        digest = hashlib.blake2b(model_name.encode('utf-8'), digest_size=4).hexdigest()
+        self.path = os.path.join(directory, f"{slug}-{digest}-{dim}.npy")
+        self.lock_path = f"{self.path}.lock"
+
+        self._lock = threading.Lock()
+        self._records = None
+        self._keys = None
+        self._stamp = None
+        self._pending = {}
+        self.reload()
+
+    def _file_stamp(self):
+        try:
+            stat = os.stat(self.path)
+        except FileNotFoundError:
+            return None
+        return (stat.st_ino, stat.st_mtime_ns, stat.st_size)
+
+    def reload(self):
+        """Re-open the backing file if another process replaced it"""
+        stamp = self._file_stamp()
+        with self._lock:
+            if stamp == self._stamp:
+                return
+            records = None
+            if stamp is not None:
+                try:
+                    records = np.load(self.path, mmap_mode='r')
+                    if records.dtype != self.dtype:
+                        logging.warning(f"Ignoring embedding store with unexpected layout: {self.path}")
+                        records = None
+                except (OSError, ValueError) as e:
+                    logging.warning(f"Could not open embedding store {self.path}: {e}")
+                    records = None
+            self._records = records
+            self._keys = records['key'] if records is not None else None
+            self._stamp = stamp
+
+    def __len__(self):
+        with self._lock:
+            return 0 if self._records is None else len(self._records)
+
+    def get(self, text):
+        """Return the stored vector for text, or None"""
+        key = text_key(text)
+        with self._lock:
+            if key in self._pending:
+                return self._pending[key]
+            if self._keys is None or not len(self._keys):
+                return None
+            index = np.searchsorted(self._keys, key)
+            if index < len(self._keys) and self._keys[index] == key:
+                return self._records['vector'][index]
+        return None
+
+    def add(self, text, vector):
+        """Queue a vector to be written on the next flush()"""
+        vector = np.asarray(vector, dtype=np.float32)
+        if vector.shape != (self.dim,):
+            raise ValueError(f"Expected a vector of shape ({self.dim},), got {vector.shape}")
+        with self._lock:
+            self._pending[text_key(text)] = vector
+            while len(self._pending) > self.max_pending:
+                del self._pending[next(iter(self._pending))]
+
+    @property
+    def pending(self):
+        """Number of vectors waiting for flush()"""
+        with self._lock:
+            return len(self._pending)
+
+    def flush(self):
+        """Merge queued vectors into the backing file; returns the number written"""
+        with self._lock:
+            if not self._pending:
+                return 0
+            pending = self._pending
+            self._pending = {}
+
+        os.makedirs(self.directory, exist_ok=True)
+        with open(self.lock_path, 'a') as lock_file:
+            if fcntl is not None:
+                fcntl.flock(lock_file, fcntl.LOCK_EX)
+            try:
+                self._merge(pending)
+            finally:
+                if fcntl is not None:
+                    fcntl.flock(lock_file, fcntl.LOCK_UN)
+
+        self.reload()
+        return len(pending)
+
+    def _merge(self, pending):
+        """Write the file on disk plus pending as a new file; call with the writer lock held"""
+        # Merge with whatever is on disk now, which may be newer than our mapping
+        try:
+            current = np.load(self.path, mmap_mode='r')
+            if current.dtype != self.dtype:
+                current = np.zeros(0, dtype=self.dtype)
+        except (FileNotFoundError, ValueError):
+            current = np.zeros(0, dtype=self.dtype)
+
+        added = np.zeros(len(pending), dtype=self.dtype)
+        added['key'] = np.fromiter(pending.keys(), dtype=np.uint64, count=len(pending))
+        added['vector'] = np.stack(list(pending.values()))
+
+        merged = np.concatenate([added, current])
+        _, first = np.unique(merged['key'], return_index=True)
+        merged = merged[first]
+
+        with atomic_write(self.path) as f:
+            np.save(f, merged)
+
+
+class EmbeddingCache:
+    """
+    Two-level embedding cache in front of an encoder.
+    Lookups go to an in-process LRU first, then to an optional EmbeddingStore,
+    and only then to the encoder. Read-only caches never write to the store,
+    so many workers can share one store built by a single writer.
+    Writable caches flush new vectors to the store as they accumulate, and
+    every cache periodically picks up a store file replaced by another process.
+    """
+
+    def __init__(self, encode_fn, model_name, dim, maxsize=4096, directory=None, read_only=False,
+                 flush_every=1024, flush_interval=60.0, reload_interval=5.0):
+        """
+        encode_fn: callable mapping a list of texts to a 2-D array of embeddings
+        flush_every / flush_interval: write new vectors to the store once this
+        many are pending or this many seconds have passed since the last write
+        reload_interval: seconds between checks for a newer store file
+        """
+        self.encode_fn = encode_fn
+        self.read_only = read_only
+        self.flush_every = flush_every
+        self.flush_interval = flush_interval
+        self.reload_interval = reload_interval
+        self._memory = LRUCache(maxsize)
+        self.store = (EmbeddingStore(directory, model_name, dim, max_pending=max(flush_every, 1) * 4)
+                      if directory else None)
+        self._lock = threading.Lock()
+        self.store_hits = 0
+        self.encoded = 0
+        self._last_flush = self._last_reload = time.monotonic()
+
+    def get(self, text):
+        """Return the embedding for one text"""
+        return self.get_many([text])[0]
+
+    def get_many(self, texts):
+        """Return embeddings for texts in order, encoding all misses in one call"""
+        if self.store is not None:
+            self._maybe_reload()
+        results = [None] * len(texts)
+        missing = {}
+        for position, text in enumerate(texts):
+            vector = self._memory.get(text)
+            if vector is None and self.store is not None:
+                vector = self.store.get(text)
+                if vector is not None:
+                    with self._lock:
+                        self.store_hits += 1
+                    self._memory.put(text, vector)
+            if vector is None:
+                missing.setdefault(text, []).append(position)
+            results[position] = vector
+
+        if missing:
+            pending = list(missing)
+            vectors = np.asarray(self.encode_fn(pending), dtype=np.float32)
+            with self._lock:
+                self.encoded += len(pending)
+            for text, vector in zip(pending, vectors):
+                # Cached arrays are shared between callers, so keep them immutable
+                vector.setflags(write=False)
+                self._memory.put(text, vector)
+                if self.store is not None and not self.read_only:
+                    self.store.add(text, vector)
+                for position in missing[text]:
+                    results[position] = vector
+            if self.store is not None and not self.read_only:
+                self._maybe_flush()
+
+        return results
+
+    def _maybe_reload(self):
+        now = time.monotonic()
+        if now - self._last_reload >= self.reload_interval:
+            self._last_reload = now
+            self.store.reload()
+
+    def _maybe_flush(self):
+        """Flush once enough vectors are pending or the flush interval has passed"""
+        now = time.monotonic()
+        if self.store.pending >= self.flush_every or now - self._last_flush >= self.flush_interval:
+            self._last_flush = now
+            try:
+                self.store.flush()
+            except OSError as e:
+                logging.error(f"Error writing embedding store {self.store.path}: {e}")
+
+    def flush(self):
+        """Persist newly encoded embeddings; returns the number written"""
+        if self.store is None or self.read_only:
+            return 0
+        return self.store.flush()
+
+    def reload(self):
+        """Pick up a store file written by another process"""
+        if self.store is not None:
+            self.store.reload()
+
+    def stats(self):
+        """
+        Get memory-cache counters plus store hits and encoder calls.
+        Top-level hits/misses count lookups served by either level versus
+        lookups that had to go to the encoder.
+        """
+        memory = self._memory.stats()
+        stats = {'memory': memory}
+        with self._lock:
+            stats['store_hits'] = self.store_hits
+            stats['encoded'] = self.encoded
+        stats['hits'] = memory['hits'] + stats['store_hits']
+        stats['misses'] = memory['misses'] - stats['store_hits']
+        stats['size'] = memory['size']
+        stats['store_size'] = len(self.store) if self.store is not None else 0
+        return stats
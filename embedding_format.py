@@ -0,0 +1,68 @@
+import base64
+
+import numpy as np
+
+# Ways get_content_recommendations can return embeddings:
+#   list     JSON list of floats (the original format)
+#   none     leave embeddings out
+#   float32  base64 of the float32 bytes
+#   float16  base64 of float16 bytes (half the size, ~1e-3 relative error)
+#   int8     base64 of int8 bytes plus a scale (a quarter of the size)
+#   raw      float32 bytes as-is, for pickle-based transports such as model_server
+EMBEDDING_FORMATS = ('list', 'none', 'float32', 'float16', 'int8', 'raw')
+
+
+def check_embedding_format(embedding_format):
+    """Validate a format name, raising ValueError for unknown ones"""
+    if embedding_format not in EMBEDDING_FORMATS:
+        raise ValueError(f"Unknown embedding format '{embedding_format}', expected one of {EMBEDDING_FORMATS}")
+    return embedding_format
+
+
+def _b64(array):
+    return base64.b64encode(np.ascontiguousarray(array).tobytes()).decode('ascii')
+
+
+def encode_embedding(vector, embedding_format='list'):
+    """
+    Encode a 1-D embedding for a response.
+    Binary formats return {'dtype', 'shape', 'data'} (plus 'scale' for int8)
+    straight from the array buffer, without building a Python list.
+    Returns None for 'none'.
+    """
+    if embedding_format == 'none':
+        return None
+    vector = np.asarray(vector, dtype=np.float32)
+    if embedding_format == 'list':
+        return vector.tolist()
+
+    shape = list(vector.shape)
+    if embedding_format == 'float32':
+        return {'dtype': 'float32', 'shape': shape, 'data': _b64(vector)}
+    if embedding_format == 'float16':
+        return {'dtype': 'float16', 'shape': shape, 'data': _b64(vector.astype(np.float16))}
+    if embedding_format == 'int8':
+        # Symmetric quantization: one scale per vector maps the largest magnitude to 127
+        peak = float(np.abs(vector).max()) if vector.size else 0.0
+        scale = peak / 127.0 if peak > 0 else 1.0
+        quantized = np.clip(np.rint(vector / scale), -127, 127).astype(np.int8)
+        return {'dtype': 'int8', 'shape': shape, 'scale': scale, 'data': _b64(quantized)}
+    if embedding_format == 'raw':
+        return {'dtype': 'float32', 'shape': shape, 'data': vector.tobytes()}
+    check_embedding_format(embedding_format)
+
+
+def decode_embedding(payload):
+    """Turn any encode_embedding output back into a float32 array (None stays None)"""
+    if payload is None:
+        return None
+    if isinstance(payload, list):
+        return np.asarray(payload, dtype=np.float32)
+
+    data = payload['data']
+    if isinstance(data, str):
+        data = base64.b64decode(data)
+    array = np.frombuffer(data, dtype=payload['dtype']).reshape(payload['shape'])
+    if payload['dtype'] == 'int8':
+        return array.astype(np.float32) * np.float32(payload['scale'])
+    return array.astype(np.float32)
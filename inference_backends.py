@@ -0,0 +1,203 @@
+import argparse
+import hashlib
+import json
+import logging
+import os
+import re
+import shutil
+import tempfile
+import time
+
+import numpy as np
+
+from caching import CACHE_DIR, shared_mode
+
+# Supported ways of running the transformer models on CPU
+BACKENDS = ('torch', 'quantized', 'onnx')
+
+# Where 'onnx' models are exported once and loaded from afterwards
+ONNX_CACHE_ENV = 'MOODSYNC_ONNX_CACHE'
+DEFAULT_ONNX_CACHE = os.path.join(CACHE_DIR, 'onnx')
+
+
+def check_backend(backend):
+    """Validate a backend name, raising ValueError for unknown ones"""
+    if backend not in BACKENDS:
+        raise ValueError(f"Unknown inference backend '{backend}', expected one of {BACKENDS}")
+    return backend
+
+
+def quantize_module(module):
+    """Dynamically quantize the Linear layers of a torch module to int8"""
+    import torch
+    return torch.quantization.quantize_dynamic(module, {torch.nn.Linear}, dtype=torch.qint8)
+
+
+def onnx_export_dir(model_name, cache_dir=None):
+    """Directory holding the ONNX export of model_name"""
+    cache_dir = cache_dir or os.environ.get(ONNX_CACHE_ENV) or DEFAULT_ONNX_CACHE
+    slug = re.sub(r'[^A-Za-z0-9_.-]+', '_', model_name)
+    digest = hashlib.blake2b(model_name.encode('utf-8'), digest_size=4).hexdigest()
+    return os.path.join(cache_dir, f"{slug}-{digest}")
+
+
+def _cached_export(model_name, export_to, cache_dir=None):
+    """
+    Return the export directory for model_name, running export_to(directory)
+    first if it does not exist yet. The export is written to a temporary
+    directory and renamed into place, so concurrent workers never load a
+    partial export; if another worker finished first, its copy is kept.
+    """
+    directory = onnx_export_dir(model_name, cache_dir)
+    if os.path.isdir(directory):
+        return directory
+
+    parent = os.path.dirname(directory)
+    os.makedirs(parent, exist_ok=True)
+    temp_dir = tempfile.mkdtemp(dir=parent, suffix='.tmp')
+    try:
+        start = time.perf_counter()
+        export_to(temp_dir)
+        # mkdtemp creates the directory 0700; workers may run as another user
+        os.chmod(temp_dir, shared_mode(0o755))
+        os.rename(temp_dir, directory)
+        logging.info(f"Exported {model_name} to ONNX in {time.perf_counter() - start:.1f}s: {directory}")
+    except OSError:
+        if not os.path.isdir(directory):
+            raise
+    finally:
+        if os.path.isdir(temp_dir):
+            shutil.rmtree(temp_dir, ignore_errors=True)
+    return directory
+
+
+def create_pipeline(task, model_name, backend='torch'):
+    """
+    Build a transformers pipeline for task using the given backend.
+    'quantized' swaps the model for an int8 dynamically quantized copy;
+    'onnx' runs the model on ONNX Runtime through optimum, exporting it to
+    the ONNX cache on first use and loading the saved export afterwards.
+    """
+    import transformers
+
+    check_backend(backend)
+    if backend == 'onnx':
+        from optimum.onnxruntime import ORTModelForSequenceClassification
+
+        def export_to(directory):
+            ORTModelForSequenceClassification.from_pretrained(model_name, export=True).save_pretrained(directory)
+            transformers.AutoTokenizer.from_pretrained(model_name).save_pretrained(directory)
+
+        directory = _cached_export(model_name, export_to)
+        model = ORTModelForSequenceClassification.from_pretrained(directory)
+        tokenizer = transformers.AutoTokenizer.from_pretrained(directory)
+        return transformers.pipeline(task, model=model, tokenizer=tokenizer)
+
+    classifier = transformers.pipeline(task, model=model_name)
+    if backend == 'quantized':
+        classifier.model = quantize_module(classifier.model)
+    return classifier
+
+
+def create_sentence_transformer(model_name, backend='torch'):
+    """Build a SentenceTransformer for model_name using the given backend"""
+    import sentence_transformers
+
+    check_backend(backend)
+    if backend == 'onnx':
+        def export_to(directory):
+            sentence_transformers.SentenceTransformer(model_name, backend='onnx').save(directory)
+
+        directory = _cached_export(model_name, export_to)
+        return sentence_transformers.SentenceTransformer(directory, backend='onnx', device='cpu')
+
+    encoder = sentence_transformers.SentenceTransformer(model_name, device='cpu')
+    if backend == 'quantized':
+        encoder = quantize_module(encoder)
+    return encoder
+
+
+def parity_report(baseline, candidate, texts):
+    """
+    Compare two AIRecommender instances (typically fp32 torch vs. another backend).
+    Reports label agreement for mood, emotion and sentiment, cosine drift of the
+    text embeddings, and the CPU time each spent on the corpus.
+    """
+    texts = [text for text in texts if text]
+    if not texts:
+        raise ValueError("parity_report needs at least one non-empty text")
+
+    def run(recommender):
+        start = time.process_time()
+        results = recommender.analyze_moods(texts)
+        embeddings = recommender._get_embeddings(texts)
+        return results, np.asarray(embeddings, dtype=np.float32), time.process_time() - start
+
+    base_results, base_embeddings, base_seconds = run(baseline)
+    cand_results, cand_embeddings, cand_seconds = run(candidate)
+
+    def agreement(extract):
+        matches = sum(extract(a) == extract(b) for a, b in zip(base_results, cand_results))
+        return matches / len(texts)
+
+    base_norm = np.linalg.norm(base_embeddings, axis=1)
+    cand_norm = np.linalg.norm(cand_embeddings, axis=1)
+    denominator = np.maximum(base_norm * cand_norm, 1e-12)
+    cosine = np.einsum('ij,ij->i', base_embeddings, cand_embeddings) / denominator
+    drift = 1.0 - cosine
+
+    return {
+        'texts': len(texts),
+        'mood_agreement': agreement(lambda result: result[0]),
+        'emotion_agreement': agreement(lambda result: result[2].get('emotion')),
+        'sentiment_agreement': agreement(lambda result: result[2].get('sentiment')),
+        'embedding_cosine_drift': {
+            'mean': float(drift.mean()),
+            'max': float(drift.max())
+        },
+        'cpu_seconds': {
+            'baseline': base_seconds,
+            'candidate': cand_seconds,
+            'speedup': base_seconds / cand_seconds if cand_seconds else None
+        },
+        'disagreements': [
+            {'text': text, 'baseline': a[0], 'candidate': b[0]}
+            for text, a, b in zip(texts, base_results, cand_results) if a[0] != b[0]
+        ][:20]
+    }
+
+
+def main(argv=None):
+    """
+    Command-line parity check: compare a backend against fp32 torch on a text file.
+    With --export-onnx, export the models to the ONNX cache instead (run once per
+    host or image build so workers start without exporting).
+    """
+    from ai_recommender import AIRecommender
+
+    parser = argparse.ArgumentParser(description="Compare an inference backend against fp32 torch")
+    parser.add_argument('texts', nargs='?', help="file with one message per line")
+    parser.add_argument('--backend', default='quantized', choices=BACKENDS)
+    parser.add_argument('--limit', type=int, default=500, help="maximum number of lines to use")
+    parser.add_argument('--export-onnx', action='store_true',
+                        help=f"export the models to ${ONNX_CACHE_ENV} (default {DEFAULT_ONNX_CACHE}) and exit")
+    args = parser.parse_args(argv)
+
+    if args.export_onnx:
+        recommender = AIRecommender(backend='onnx', bundle=False)
+        recommender.warmup()
+        print(json.dumps(recommender.startup_report(), indent=2))
+        return
+    if not args.texts:
+        parser.error("a texts file is required unless --export-onnx is given")
+
+    with open(args.texts, encoding='utf-8') as f:
+        texts = [line.strip() for _, line in zip(range(args.limit), f)]
+
+    report = parity_report(AIRecommender(backend='torch'), AIRecommender(backend=args.backend), texts)
+    print(json.dumps(report, indent=2))
+
+
+if __name__ == '__main__':
+    logging.basicConfig(level=logging.INFO)
+    main()
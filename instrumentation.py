@@ -0,0 +1,222 @@
+import bisect
+import os
+import threading
+import time
+import weakref
+
+# Histogram bucket upper bounds for stage latencies, in seconds
+STAGE_BUCKETS = (0.0001, 0.00025, 0.0005, 0.001, 0.0025, 0.005, 0.01, 0.025,
+                 0.05, 0.1, 0.25, 0.5, 1.0, 2.5, 5.0, 10.0)
+
+
+class _NullTimer:
+    """Shared no-op timer handed out while metrics are off and no trace is attached"""
+
+    __slots__ = ()
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, *exc_info):
+        return False
+
+
+NULL_TIMER = _NullTimer()
+
+
+class _StageTimer:
+    __slots__ = ('registry', 'stage', 'trace', 'start')
+
+    def __init__(self, registry, stage, trace):
+        self.registry = registry
+        self.stage = stage
+        self.trace = trace
+
+    def __enter__(self):
+        self.start = time.perf_counter()
+        return self
+
+    def __exit__(self, *exc_info):
+        elapsed = time.perf_counter() - self.start
+        if self.registry.enabled:
+            self.registry.observe(self.stage, elapsed)
+        if self.trace is not None:
+            self.trace.record(self.stage, elapsed)
+        return False
+
+
+class Trace:
+    """
+    Per-request record of stage timings and annotations.
+    Pass one to an analysis call to see where that request spent its time,
+    whether or not the registry is enabled.
+    """
+
+    def __init__(self, name=None):
+        self.name = name
+        self.spans = []
+        self.annotations = {}
+
+    def record(self, stage, seconds):
+        """Add one timed stage; stages nest, so inner spans are recorded first"""
+        self.spans.append((stage, seconds))
+
+    def annotate(self, key, value):
+        self.annotations[key] = value
+
+    def durations(self):
+        """Total seconds per stage"""
+        totals = {}
+        for stage, seconds in self.spans:
+            totals[stage] = totals.get(stage, 0.0) + seconds
+        return totals
+
+    def as_dict(self):
+        return {
+            'name': self.name,
+            'spans': [{'stage': stage, 'seconds': seconds} for stage, seconds in self.spans],
+            'annotations': dict(self.annotations)
+        }
+
+
+class MetricsRegistry:
+    """
+    In-process store of stage latency histograms, event counters and cache counters.
+    While disabled, timer() returns a shared no-op object and increment() returns
+    immediately, so instrumented code pays only an attribute check. Caches are
+    read when a snapshot or export is taken, never on the request path.
+    """
+
+    def __init__(self, enabled=False, namespace='moodsync', buckets=STAGE_BUCKETS):
+        self.enabled = enabled
+        self.namespace = namespace
+        self.buckets = tuple(buckets)
+        self._lock = threading.Lock()
+        self._stages = {}
+        self._counters = {}
+        self._caches = {}
+
+    def enable(self):
+        self.enabled = True
+
+    def disable(self):
+        self.enabled = False
+
+    def timer(self, stage, trace=None):
+        """Context manager timing one stage into the registry and/or trace"""
+        if not self.enabled and trace is None:
+            return NULL_TIMER
+        return _StageTimer(self, stage, trace)
+
+    def observe(self, stage, seconds):
+        """Record one stage duration"""
+        with self._lock:
+            stats = self._stages.get(stage)
+            if stats is None:
+                stats = self._stages[stage] = {'count': 0, 'sum': 0.0, 'buckets': [0] * (len(self.buckets) + 1)}
+            stats['count'] += 1
+            stats['sum'] += seconds
+            stats['buckets'][bisect.bisect_left(self.buckets, seconds)] += 1
+
+    def increment(self, event, amount=1):
+        """Count an event such as a fallback or an error"""
+        if not self.enabled:
+            return
+        with self._lock:
+            self._counters[event] = self._counters.get(event, 0) + amount
+
+    def register_cache(self, name, cache):
+        """
+        Report a cache's hit rate under name. cache.stats() must return a dict
+        with 'hits' and 'misses'; caches registered under the same name (one
+        per analyzer instance) are summed. Caches are held weakly.
+        """
+        with self._lock:
+            self._caches.setdefault(name, weakref.WeakSet()).add(cache)
+
+    def cache_stats(self):
+        """Summed hits, misses, size and hit rate per registered cache name"""
+        with self._lock:
+            caches = {name: list(members) for name, members in self._caches.items()}
+
+        result = {}
+        for name, members in caches.items():
+            hits = misses = size = 0
+            for cache in members:
+                stats = cache.stats()
+                hits += stats['hits']
+                misses += stats['misses']
+                size += stats.get('size', 0)
+            lookups = hits + misses
+            result[name] = {
+                'hits': hits,
+                'misses': misses,
+                'size': size,
+                'hit_rate': hits / lookups if lookups else 0.0
+            }
+        return result
+
+    def snapshot(self):
+        """Current stage, counter and cache values as plain dicts"""
+        with self._lock:
+            stages = {
+                stage: {
+                    'count': stats['count'],
+                    'sum': stats['sum'],
+                    'mean': stats['sum'] / stats['count'] if stats['count'] else 0.0,
+                    'buckets': list(stats['buckets'])
+                }
+                for stage, stats in self._stages.items()
+            }
+            counters = dict(self._counters)
+        return {'stages': stages, 'counters': counters, 'caches': self.cache_stats()}
+
+    def reset(self):
+        """Clear stage timings and counters; registered caches stay registered"""
+        with self._lock:
+            self._stages.clear()
+            self._counters.clear()
+
+    def export_prometheus(self):
+        """Render the registry in the Prometheus text exposition format"""
+        snapshot = self.snapshot()
+        prefix = self.namespace
+        lines = []
+
+        lines.append(f"# HELP {prefix}_stage_seconds Time spent in each analysis stage")
+        lines.append(f"# TYPE {prefix}_stage_seconds histogram")
+        for stage, stats in sorted(snapshot['stages'].items()):
+            label = f'stage="{_escape(stage)}"'
+            cumulative = 0
+            for bound, count in zip(self.buckets + (float('inf'),), stats['buckets']):
+                cumulative += count
+                le = '+Inf' if bound == float('inf') else repr(bound)
+                lines.append(f'{prefix}_stage_seconds_bucket{{{label},le="{le}"}} {cumulative}')
+            lines.append(f"{prefix}_stage_seconds_sum{{{label}}} {stats['sum']!r}")
+            lines.append(f"{prefix}_stage_seconds_count{{{label}}} {stats['count']}")
+
+        lines.append(f"# HELP {prefix}_events_total Pipeline events such as fallbacks and errors")
+        lines.append(f"# TYPE {prefix}_events_total counter")
+        for event, count in sorted(snapshot['counters'].items()):
+            lines.append(f'{prefix}_events_total{{event="{_escape(event)}"}} {count}')
+
+        for metric, kind, help_text in (('hits', 'counter', 'Cache hits'),
+                                        ('misses', 'counter', 'Cache misses'),
+                                        ('size', 'gauge', 'Cached entries'),
+                                        ('hit_rate', 'gauge', 'Cache hit ratio')):
+            suffix = '_total' if kind == 'counter' else ''
+            name = f"{prefix}_cache_{metric}{suffix}"
+            lines.append(f"# HELP {name} {help_text}")
+            lines.append(f"# TYPE {name} {kind}")
+            for cache, stats in sorted(snapshot['caches'].items()):
+                lines.append(f'{name}{{cache="{_escape(cache)}"}} {stats[metric]!r}')
+
+        return '\n'.join(lines) + '\n'
+
+
+def _escape(value):
+    return value.replace('\\', '\\\\').replace('"', '\\"').replace('\n', '\\n')
+
+
+# Process-wide default registry; MOODSYNC_METRICS=1 turns it on at startup
+REGISTRY = MetricsRegistry(enabled=os.environ.get('MOODSYNC_METRICS') == '1')
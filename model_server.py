@@ -0,0 +1,288 @@
+import argparse
+import gc
+import logging
+import os
+import stat
+import tempfile
+import threading
+import time
+from multiprocessing.connection import Client, Listener
+
+from batching import BatchingRecommender
+
+# Shared secret for the connection handshake; both ends refuse to run without it,
+# since requests and replies are pickles
+AUTHKEY_ENV = 'MOODSYNC_MODEL_SERVER_KEY'
+
+# Default Unix socket for the local inference sidecar, inside a private per-user directory
+SOCKET_NAME = 'models.sock'
+
+# Methods a client may call on the hosted AIRecommender
+REMOTE_METHODS = (
+    'analyze_mood', 'analyze_moods', 'get_content_recommendations',
+    'rank_moods', 'get_embedding', 'get_embeddings', 'models_loaded', 'startup_report'
+)
+
+
+class ModelServerError(RuntimeError):
+    """Raised when the inference sidecar cannot be reached or reports an error"""
+
+
+def default_socket():
+    """$XDG_RUNTIME_DIR/moodsync/models.sock, or /tmp/moodsync-<uid>/models.sock without one"""
+    runtime_dir = os.environ.get('XDG_RUNTIME_DIR')
+    if runtime_dir:
+        directory = os.path.join(runtime_dir, 'moodsync')
+    else:
+        directory = os.path.join(tempfile.gettempdir(), f'moodsync-{os.getuid()}')
+    return os.path.join(directory, SOCKET_NAME)
+
+
+def _private_dir(directory):
+    """Create directory with mode 0700, or check that an existing one is ours and not shared"""
+    try:
+        os.mkdir(directory, 0o700)
+    except FileExistsError:
+        pass
+    info = os.lstat(directory)
+    if not stat.S_ISDIR(info.st_mode) or info.st_uid != os.getuid() or info.st_mode & 0o077:
+        raise PermissionError(f"{directory} must be a directory owned by this user with mode 0700")
+
+
+def server_authkey():
+    """The handshake key from $MOODSYNC_MODEL_SERVER_KEY; raises ModelServerError when unset"""
+    authkey = os.environ.get(AUTHKEY_ENV)
+    if not authkey:
+        raise ModelServerError(f"Set ${AUTHKEY_ENV} to a shared secret for the model server")
+    return authkey.encode('utf-8')
+
+
+def preload_for_fork(recommender, models=('emotion', 'sentiment', 'embedding')):
+    """
+    Load and warm models in a parent process before workers are forked
+    (e.g. from a gunicorn config with preload_app = True).
+    Freezing the GC keeps collections in the children from touching the
+    parent's objects, so the model weights stay shared copy-on-write.
+    """
+    report = recommender.warmup(models)
+    gc.collect()
+    gc.freeze()
+    return report
+
+
+class ModelServer:
+    """
+    Local inference sidecar: one process holds the models and serves
+    AIRecommender calls to request workers over a Unix socket.
+    Concurrent analyze_mood / get_content_recommendations calls from different
+    workers are coalesced into shared batches.
+    """
+
+    def __init__(self, recommender, address=None, authkey=None,
+                 max_batch_size=16, max_wait_ms=5.0):
+        """
+        address: Unix socket path (default_socket() by default)
+        authkey: shared secret clients must prove; defaults to $MOODSYNC_MODEL_SERVER_KEY
+        and is required
+        """
+        self.recommender = recommender
+        self.address = address or default_socket()
+        self.authkey = authkey or server_authkey()
+        self.batcher = BatchingRecommender(recommender, max_batch_size, max_wait_ms)
+        self._listener = None
+        self._stopping = threading.Event()
+
+        self._handlers = {
+            'analyze_mood': self.batcher.analyze_mood,
+            'analyze_moods': recommender.analyze_moods,
+            'get_content_recommendations': self.batcher.get_content_recommendations,
+            'rank_moods': recommender.rank_moods,
+            'get_embedding': recommender._get_embedding,
+            'get_embeddings': recommender._get_embeddings,
+            'models_loaded': lambda: recommender.models_loaded,
+            'startup_report': recommender.startup_report
+        }
+
+    def serve_forever(self):
+        """Accept worker connections until stop() is called"""
+        if self.address == default_socket():
+            _private_dir(os.path.dirname(self.address))
+        try:
+            if not stat.S_ISSOCK(os.lstat(self.address).st_mode):
+                raise FileExistsError(f"{self.address} exists and is not a socket")
+            os.unlink(self.address)
+        except FileNotFoundError:
+            pass
+        # Create the socket as 0600 rather than chmod-ing it after it is reachable
+        umask = os.umask(0o177)
+        try:
+            self._listener = Listener(self.address, family='AF_UNIX', authkey=self.authkey)
+        finally:
+            os.umask(umask)
+        logging.info(f"Model server listening on {self.address}")
+
+        try:
+            while not self._stopping.is_set():
+                try:
+                    connection = self._listener.accept()
+                except OSError:
+                    if self._stopping.is_set():
+                        break
+                    raise
+                except Exception as e:
+                    # Failed handshakes (e.g. wrong authkey) should not stop the server
+                    logging.error(f"Rejected model server connection: {e}")
+                    continue
+                threading.Thread(target=self._serve_connection, args=(connection,), daemon=True).start()
+        finally:
+            self.batcher.close()
+            if os.path.exists(self.address):
+                os.unlink(self.address)
+
+    def _serve_connection(self, connection):
+        """Answer requests from one worker connection until it closes"""
+        with connection:
+            while True:
+                try:
+                    method, args, kwargs = connection.recv()
+                except (EOFError, OSError):
+                    return
+
+                handler = self._handlers.get(method)
+                if handler is None:
+                    reply = ('error', f"Unknown method '{method}'")
+                else:
+                    try:
+                        reply = ('ok', handler(*args, **kwargs))
+                    except Exception as e:
+                        logging.error(f"Model server error in {method}: {e}")
+                        reply = ('error', f"{type(e).__name__}: {e}")
+
+                try:
+                    connection.send(reply)
+                except (EOFError, OSError):
+                    return
+
+    def stop(self):
+        """Stop accepting connections"""
+        self._stopping.set()
+        if self._listener is not None:
+            self._listener.close()
+
+
+class RemoteRecommender:
+    """
+    Client for ModelServer with the same interface as AIRecommender.
+    Each thread keeps its own connection, reopened after a failure.
+    """
+
+    def __init__(self, address=None, authkey=None):
+        """authkey defaults to $MOODSYNC_MODEL_SERVER_KEY and is required"""
+        self.address = address or default_socket()
+        self.authkey = authkey or server_authkey()
+        self._local = threading.local()
+
+    def _connection(self):
+        connection = getattr(self._local, 'connection', None)
+        if connection is None:
+            connection = Client(self.address, family='AF_UNIX', authkey=self.authkey)
+            self._local.connection = connection
+        return connection
+
+    def _call(self, method, *args, **kwargs):
+        try:
+            connection = self._connection()
+            connection.send((method, args, kwargs))
+            status, payload = connection.recv()
+        except (OSError, EOFError) as e:
+            connection = getattr(self._local, 'connection', None)
+            if connection is not None:
+                connection.close()
+                self._local.connection = None
+            raise ModelServerError(f"Model server at {self.address} unavailable: {e}") from e
+
+        if status != 'ok':
+            raise ModelServerError(payload)
+        return payload
+
+    @property
+    def models_loaded(self):
+        """False when the sidecar is unreachable or its models failed to load"""
+        try:
+            return self._call('models_loaded')
+        except ModelServerError:
+            return False
+
+    def _traced_call(self, trace, stage, method, *args, **kwargs):
+        # A trace cannot cross the socket; record the round trip on this side
+        if trace is None:
+            return self._call(method, *args, **kwargs)
+        start = time.perf_counter()
+        try:
+            return self._call(method, *args, **kwargs)
+        finally:
+            trace.record(stage, time.perf_counter() - start)
+
+    def analyze_mood(self, text, trace=None):
+        return self._traced_call(trace, 'remote.analyze_mood', 'analyze_mood', text)
+
+    def analyze_moods(self, texts):
+        return self._call('analyze_moods', list(texts))
+
+    def get_content_recommendations(self, text, mood_category, mood_context, query_embedding=None,
+                                    top_k=10, trace=None, embedding_format='list'):
+        # 'raw' embeddings cross the socket as bytes, without a float list in between
+        return self._traced_call(trace, 'remote.get_content_recommendations', 'get_content_recommendations',
+                                 text, mood_category, mood_context, query_embedding=query_embedding,
+                                 top_k=top_k, embedding_format=embedding_format)
+
+    def rank_moods(self, text):
+        return self._call('rank_moods', text)
+
+    def _get_embedding(self, text):
+        return self._call('get_embedding', text)
+
+    def _get_embeddings(self, texts):
+        return self._call('get_embeddings', list(texts))
+
+    def startup_report(self):
+        return self._call('startup_report')
+
+    def close(self):
+        connection = getattr(self._local, 'connection', None)
+        if connection is not None:
+            connection.close()
+            self._local.connection = None
+
+
+def main(argv=None):
+    """Run the inference sidecar"""
+    from ai_recommender import AIRecommender
+
+    parser = argparse.ArgumentParser(description="Host MoodSync transformer models for local workers")
+    parser.add_argument('--socket', default=None,
+                        help="Unix socket path to listen on ($XDG_RUNTIME_DIR/moodsync/models.sock by default)")
+    parser.add_argument('--backend', default='torch', help="inference backend for AIRecommender")
+    parser.add_argument('--embedding-cache-dir', default=None)
+    parser.add_argument('--max-batch-size', type=int, default=16)
+    parser.add_argument('--max-wait-ms', type=float, default=5.0)
+    args = parser.parse_args(argv)
+
+    try:
+        authkey = server_authkey()
+    except ModelServerError as e:
+        parser.error(str(e))
+
+    recommender = AIRecommender(embedding_cache_dir=args.embedding_cache_dir, backend=args.backend)
+    logging.info(f"Model warm-up: {recommender.warmup()}")
+
+    server = ModelServer(recommender, args.socket, authkey, args.max_batch_size, args.max_wait_ms)
+    try:
+        server.serve_forever()
+    except KeyboardInterrupt:
+        server.stop()
+
+
+if __name__ == '__main__':
+    logging.basicConfig(level=logging.INFO)
+    main()
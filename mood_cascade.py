@@ -0,0 +1,104 @@
+import logging
+import threading
+
+from moodanalyser import MoodAnalyzer
+
+
+class CascadeAnalyzer:
+    """
+    Two-tier mood analysis.
+    The lexicon-based MoodAnalyzer answers every request first; the transformer-based
+    AIRecommender is only consulted when the lexicon result is not confident enough
+    or its top two moods are too close to call.
+    """
+
+    LEXICON = 'lexicon'
+    TRANSFORMER = 'transformer'
+
+    def __init__(self, lexicon=None, recommender=None, confidence_threshold=0.8,
+                 min_margin=0.2, fallback_on_neutral=True):
+        """
+        lexicon: MoodAnalyzer instance (a new one is created when omitted)
+        recommender: optional AIRecommender used for ambiguous text
+        confidence_threshold: lexicon confidence needed to skip the transformer tier
+        min_margin: weighted gap between the top two lexicon moods needed to skip it
+        fallback_on_neutral: escalate when the lexicon finds no mood at all
+        """
+        self.lexicon = lexicon if lexicon is not None else MoodAnalyzer()
+        self.recommender = recommender
+        self.confidence_threshold = confidence_threshold
+        self.min_margin = min_margin
+        self.fallback_on_neutral = fallback_on_neutral
+
+        self._lock = threading.Lock()
+        self._tier_counts = {self.LEXICON: 0, self.TRANSFORMER: 0}
+        self._escalations = 0
+
+    def needs_fallback(self, mood, confidence, margin):
+        """Decide whether a lexicon result is too uncertain to return as-is"""
+        if self.fallback_on_neutral and mood == 'neutral':
+            return True
+        return confidence < self.confidence_threshold or margin < self.min_margin
+
+    def analyze_mood(self, text):
+        """
+        Analyze mood with the cheapest tier that is confident enough.
+        Returns tuple of (mood_category, confidence_score, mood_context); mood_context
+        always has a 'tier' entry naming the analyzer that produced the answer.
+        """
+        mood, confidence, margin = self.lexicon.analyze_mood_with_margin(text)
+        lexicon_context = {
+            'tier': self.LEXICON,
+            'lexicon_mood': mood,
+            'lexicon_confidence': confidence,
+            'lexicon_margin': margin
+        }
+
+        if text and self._transformer_available() and self.needs_fallback(mood, confidence, margin):
+            with self._lock:
+                self._escalations += 1
+            result = self._transformer_analysis(text)
+            if result is not None:
+                ai_mood, ai_confidence, mood_context = result
+                context = dict(mood_context)
+                context.update(lexicon_context)
+                context['tier'] = self.TRANSFORMER
+                self._record(self.TRANSFORMER)
+                return (ai_mood, ai_confidence, context)
+
+        self._record(self.LEXICON)
+        return (mood, confidence, lexicon_context)
+
+    def _transformer_available(self):
+        """Check whether the transformer tier can be used at all"""
+        return self.recommender is not None and getattr(self.recommender, 'models_loaded', False)
+
+    def _transformer_analysis(self, text):
+        """Run the transformer tier, returning None if it could not produce a result"""
+        try:
+            mood, confidence, mood_context = self.recommender.analyze_mood(text)
+        except Exception as e:
+            logging.error(f"Transformer tier failed: {e}")
+            return None
+
+        # AIRecommender signals internal failures with an empty context
+        if not mood_context:
+            return None
+        return (mood, float(confidence), mood_context)
+
+    def _record(self, tier):
+        with self._lock:
+            self._tier_counts[tier] += 1
+
+    def tier_stats(self):
+        """
+        Get how many requests each tier answered.
+        Escalations that failed and fell back to the lexicon count as lexicon answers.
+        """
+        with self._lock:
+            total = sum(self._tier_counts.values())
+            stats = dict(self._tier_counts)
+            stats['escalations'] = self._escalations
+            stats['total'] = total
+            stats['lexicon_ratio'] = self._tier_counts[self.LEXICON] / total if total else 0.0
+            return stats
@@ -0,0 +1,368 @@
+import argparse
+import importlib.util
+import json
+import os
+import re
+import sys
+import time
+from xml.etree import ElementTree
+
+import numpy as np
+
+from caching import CACHE_DIR, atomic_write
+
+# Compiled lexicon cache, built from TextBlob's en-sentiment.xml on first use
+DEFAULT_LEXICON_PATH = os.path.join(CACHE_DIR, 'en-sentiment.npz')
+LEXICON_FORMAT_VERSION = 2
+
+# Tokenizer and scoring rules below reproduce TextBlob's PatternAnalyzer
+# (textblob/_text.py: find_tokens and Sentiment.assessments) so polarity and
+# subjectivity match it; the tables are copied so TextBlob need not be imported.
+PUNCTUATION = ".,;:!?()[]{}`''\"@#$^&*+-|=~_"
+_LEADING = tuple(PUNCTUATION.replace('.', ''))
+_TRAILING = _LEADING + ('.',)
+
+ABBREVIATIONS = frozenset((
+    'a.', 'adj.', 'adv.', 'al.', 'a.m.', 'c.', 'cf.', 'comp.', 'conf.', 'def.', 'ed.', 'e.g.',
+    'esp.', 'etc.', 'ex.', 'f.', 'fig.', 'gen.', 'id.', 'i.e.', 'int.', 'l.', 'm.', 'Med.', 'Mil.',
+    'Mr.', 'n.', 'n.q.', 'orig.', 'pl.', 'pred.', 'pres.', 'p.m.', 'ref.', 'v.', 'vs.', 'w/'
+))
+RE_ABBR1 = re.compile(r"^[A-Za-z]\.$")
+RE_ABBR2 = re.compile(r"^([A-Za-z]\.)+$")
+RE_ABBR3 = re.compile("^[A-Z][" + "|".join("bcdfghjklmnpqrstvwxz") + "]+.$")
+
+# (expression, polarity) -> emoticons; order matters when an emoticon is listed twice
+EMOTICONS = (
+    (('love', +1.00), ("<3", "♥")),
+    (('grin', +1.00), (">:D", ":-D", ":D", "=-D", "=D", "X-D", "x-D", "XD", "xD", "8-D")),
+    (('taunt', +0.75), (">:P", ":-P", ":P", ":-p", ":p", ":-b", ":b", ":c)", ":o)", ":^)")),
+    (('smile', +0.50), (">:)", ":-)", ":)", "=)", "=]", ":]", ":}", ":>", ":3", "8)", "8-)")),
+    (('wink', +0.25), (">;]", ";-)", ";)", ";-]", ";]", ";D", ";^)", "*-)", "*)")),
+    (('gasp', +0.05), (">:o", ":-O", ":O", ":o", ":-o", "o_O", "o.O", "°O°", "°o°")),
+    (('worry', -0.25), (">:/", ":-/", ":/", ":\\", ">:\\", ":-.", ":-s", ":s", ":S", ":-S", ">.>")),
+    (('frown', -0.75), (">:[", ":-(", ":(", "=(", ":-[", ":[", ":{", ":-<", ":c", ":-c", "=/")),
+    (('cry', -1.00), (":'(", ":'''(", ";'(")),
+)
+RE_EMOTICONS = re.compile(r"(%s)($|\s)" % "|".join(
+    r" ?".join(re.escape(char) for char in emoticon) for _, emoticons in EMOTICONS for emoticon in emoticons))
+RE_SARCASM = re.compile(r"\( ?\! ?\)")
+RE_CONTRACTIONS = re.compile(r"('d|'m|'s|'ll|'re|'ve|n't)")
+RE_LINEBREAK = re.compile(r"\n{2,}")
+QUOTES = str.maketrans({'“': ' “ ', '”': ' ” ', '‘': ' ‘ ', '’': ' ’ ', "'": " ' ", '"': ' " '})
+CONTRACTIONS = frozenset(("'d", "'m", "'s", "'ll", "'re", "'ve", "n't"))
+SENTENCE_END = frozenset(('...', '.', '!', '?', 'END-OF-SENTENCE'))
+SENTENCE_TRAIL = frozenset(("'", '"', '”', '’', '...', '.', '!', '?', ')', 'END-OF-SENTENCE'))
+EOS = 'END-OF-SENTENCE'
+
+NEGATIONS = frozenset(('no', 'not', "n't", 'never'))
+
+_EMOTICON_POLARITY = {}
+for (_, polarity), emoticons in EMOTICONS:
+    for emoticon in emoticons:
+        _EMOTICON_POLARITY.setdefault(emoticon.lower(), polarity)
+
+
+def textblob_xml_path():
+    """Location of TextBlob's en-sentiment.xml, found without importing TextBlob"""
+    spec = importlib.util.find_spec('textblob')
+    if spec is None or not spec.submodule_search_locations:
+        raise FileNotFoundError("TextBlob is not installed; pass the en-sentiment.xml path explicitly")
+    return os.path.join(list(spec.submodule_search_locations)[0], 'en', 'en-sentiment.xml')
+
+
+def _avg(values):
+    return sum(values) / float(len(values) or 1)
+
+
+def parse_xml(path):
+    """
+    Read en-sentiment.xml into {word: (polarity, subjectivity, intensity, is_modifier)}
+    the way TextBlob's English Sentiment.load does: scores averaged over word
+    senses and parts of speech, adjectives also entered as -ly adverbs.
+    """
+    words = {}
+    for node in ElementTree.parse(path).getroot().findall('word'):
+        form = node.attrib.get('form')
+        if form:
+            scores = (float(node.attrib.get('polarity', 0.0)),
+                      float(node.attrib.get('subjectivity', 0.0)),
+                      float(node.attrib.get('intensity', 1.0)))
+            words.setdefault(form, {}).setdefault(node.attrib.get('pos'), []).append(scores)
+
+    for form in words:
+        words[form] = {pos: [_avg(each) for each in zip(*senses)] for pos, senses in words[form].items()}
+    for form, by_pos in list(words.items()):
+        by_pos[None] = [_avg(each) for each in zip(*by_pos.values())]
+
+    # "terrible" -> "terribly", "happy" -> "happily"
+    for form, by_pos in list(words.items()):
+        if 'JJ' in by_pos:
+            adverb = form[:-1] + 'i' if form.endswith('y') else form
+            adverb = adverb[:-2] if adverb.endswith('le') else adverb
+            entry = words.setdefault(adverb + 'ly', {})
+            entry['RB'] = entry[None] = tuple(by_pos['JJ'])
+
+    return {form: tuple(by_pos[None]) + ('RB' in by_pos,) for form, by_pos in words.items()}
+
+
+def _sorted_arrays(lexicon):
+    forms = sorted(lexicon, key=lambda form: form.encode('utf-8'))
+    return (np.array([form.encode('utf-8') for form in forms], dtype=bytes),
+            np.array([lexicon[form][:3] for form in forms], dtype=np.float64),
+            np.array([lexicon[form][3] for form in forms], dtype=bool))
+
+
+def lexicon_arrays(xml_path=None):
+    """
+    The compiled lexicon as arrays: words as a sorted fixed-width array of
+    UTF-8 bytes, (words x 3) polarity/subjectivity/intensity and the modifier
+    flags, all in the same row order
+    """
+    return _sorted_arrays(parse_xml(xml_path or textblob_xml_path()))
+
+
+def compile_lexicon(xml_path=None, output_path=DEFAULT_LEXICON_PATH):
+    """Compile en-sentiment.xml into a compact .npz lexicon; returns the output path"""
+    forms, scores, modifiers = lexicon_arrays(xml_path)
+    with atomic_write(output_path) as f:
+        np.savez(f, version=np.array(LEXICON_FORMAT_VERSION), forms=forms, scores=scores, modifiers=modifiers)
+    return output_path
+
+
+def tokenize(text):
+    """Lowercased tokens exactly as TextBlob's sentiment analyzer sees them"""
+    text = RE_CONTRACTIONS.sub(r" \1", text).translate(QUOTES).replace('\r\n', '\n')
+    text = RE_LINEBREAK.sub(f" {EOS} ", text)
+
+    tokens = []
+    for token in text.split():
+        tail = []
+        while token.startswith(_LEADING) and token not in CONTRACTIONS:
+            tokens.append(token[0])
+            token = token[1:]
+        while token.endswith(_TRAILING) and token not in CONTRACTIONS:
+            if token.endswith(_LEADING):
+                tail.append(token[-1])
+                token = token[:-1]
+            if token.endswith('...'):
+                tail.append('...')
+                token = token[:-3].rstrip('.')
+            if token.endswith('.'):
+                if (token in ABBREVIATIONS or RE_ABBR1.match(token) or RE_ABBR2.match(token)
+                        or RE_ABBR3.match(token)):
+                    break
+                tail.append(token[-1])
+                token = token[:-1]
+        if token:
+            tokens.append(token)
+        tokens.extend(reversed(tail))
+
+    # Sentence boundaries limit where emoticons and "(!)" can be re-joined
+    sentences, i, j = [[]], 0, 0
+    while j < len(tokens):
+        if tokens[j] in SENTENCE_END:
+            while j < len(tokens) and tokens[j] in SENTENCE_TRAIL:
+                if tokens[j] in ("'", '"') and sentences[-1].count(tokens[j]) % 2 == 0:
+                    break
+                j += 1
+            sentences[-1].extend(t for t in tokens[i:j] if t != EOS)
+            sentences.append([])
+            i = j
+        j += 1
+    sentences[-1].extend(tokens[i:j])
+
+    words = []
+    for sentence in sentences:
+        if sentence:
+            sentence = RE_SARCASM.sub('(!)', ' '.join(sentence))
+            sentence = RE_EMOTICONS.sub(lambda m: m.group(1).replace(' ', '') + m.group(2), sentence)
+            words.extend(sentence.lower().split())
+    return words
+
+
+class SentimentLexicon:
+    """
+    Compiled polarity/subjectivity lexicon with a single-pass scorer.
+    Gives TextBlob(text).sentiment's numbers without building TextBlob,
+    word or assessment objects per call. Words are looked up by binary search
+    over the lexicon_arrays() arrays, which are used as given, so arrays
+    memory-mapped from an artifact bundle stay shared between processes.
+    """
+
+    def __init__(self, forms, scores, modifiers):
+        """forms, scores, modifiers: lexicon_arrays() output"""
+        self.forms = forms
+        self.scores = scores
+        self.modifiers = modifiers
+
+    @classmethod
+    def from_dict(cls, lexicon):
+        """Build from parse_xml() output: {word: (polarity, subjectivity, intensity, is_modifier)}"""
+        return cls(*_sorted_arrays(lexicon))
+
+    @classmethod
+    def load(cls, path=DEFAULT_LEXICON_PATH, compile_missing=True):
+        """
+        Load a compiled lexicon, compiling it from TextBlob's XML if the file
+        is missing or was written in an older format
+        """
+        if not os.path.exists(path):
+            if not compile_missing:
+                raise FileNotFoundError(path)
+            compile_lexicon(output_path=path)
+        with np.load(path, allow_pickle=False) as data:
+            version = int(data['version'])
+            if version == LEXICON_FORMAT_VERSION:
+                return cls(data['forms'], data['scores'], data['modifiers'])
+        if not compile_missing:
+            raise ValueError(f"Unsupported sentiment lexicon version {version} in {path}")
+        compile_lexicon(output_path=path)
+        return cls.load(path, compile_missing=False)
+
+    def __len__(self):
+        return len(self.forms)
+
+    def _entries(self, words):
+        """(polarity, subjectivity, intensity, is_modifier) per word, None when not in the lexicon"""
+        entries = [None] * len(words)
+        if not words or not len(self.forms):
+            return entries
+        keys = np.array([word.encode('utf-8') for word in words], dtype=bytes)
+        rows = np.minimum(np.searchsorted(self.forms, keys), len(self.forms) - 1)
+        found = np.flatnonzero(self.forms[rows] == keys)
+        if len(found):
+            hits = rows[found]
+            for position, scores, is_modifier in zip(found.tolist(), self.scores[hits].tolist(),
+                                                     self.modifiers[hits].tolist()):
+                entries[position] = (*scores, is_modifier)
+        return entries
+
+    def sentiment(self, text):
+        """(polarity, subjectivity) of text, matching TextBlob's PatternAnalyzer"""
+        assessed = []       # [polarity, subjectivity, intensity, negated] per scored chunk
+        modifier = None     # preceding modifier word ("very good")
+        negation = None     # preceding negation ("not good")
+
+        words = tokenize(text)
+        for word, entry in zip(words, self._entries(words)):
+            if entry is not None:
+                polarity, subjectivity, intensity, is_modifier = entry
+                if modifier is None:
+                    assessed.append([polarity, subjectivity, intensity, False])
+                else:
+                    last = assessed[-1]
+                    last[0] = max(-1.0, min(polarity * last[2], 1.0))
+                    last[1] = max(-1.0, min(subjectivity * last[2], 1.0))
+                    last[2] = intensity
+                if negation is not None:
+                    assessed[-1][2] = 1.0 / assessed[-1][2]
+                    assessed[-1][3] = True
+                modifier = word if is_modifier else None
+                negation = word if word in NEGATIONS else None
+                continue
+
+            if word in NEGATIONS:
+                negation = word
+            elif negation and len(word.strip("'")) > 1:
+                negation = None
+            if negation is not None and modifier is not None and modifier.endswith('ly'):
+                assessed[-1][3] = True
+                negation = None
+            elif modifier and len(word) > 2:
+                modifier = None
+            if word == '!' and assessed:
+                assessed[-1][0] = max(-1.0, min(assessed[-1][0] * 1.25, 1.0))
+            if word == '(!)':
+                assessed.append([0.0, 1.0, 1.0, False])
+            if not word.isalpha() and len(word) <= 5 and word not in PUNCTUATION:
+                polarity = _EMOTICON_POLARITY.get(word)
+                if polarity is not None:
+                    assessed.append([polarity, 1.0, 1.0, False])
+
+        if not assessed:
+            return (0.0, 0.0)
+        polarity = sum(p * -0.5 if negated else p for p, _, _, negated in assessed) / len(assessed)
+        subjectivity = sum(s for _, s, _, _ in assessed) / len(assessed)
+        return (polarity, subjectivity)
+
+
+def parity_report(texts, path=DEFAULT_LEXICON_PATH):
+    """
+    Compare the compiled lexicon at path with TextBlob on texts:
+    polarity/subjectivity differences, time to the first result (load plus
+    one message; TextBlob's includes its import unless already imported) and
+    steady-state time per message.
+    """
+    texts = [text for text in texts if text]
+    if not texts:
+        raise ValueError("parity_report needs at least one non-empty text")
+
+    start = time.perf_counter()
+    lexicon = SentimentLexicon.load(path)
+    lexicon.sentiment(texts[0])
+    compiled_startup = time.perf_counter() - start
+
+    start = time.perf_counter()
+    from textblob import TextBlob
+    TextBlob(texts[0]).sentiment
+    textblob_startup = time.perf_counter() - start
+
+    start = time.perf_counter()
+    compiled = [lexicon.sentiment(text) for text in texts]
+    compiled_seconds = time.perf_counter() - start
+    start = time.perf_counter()
+    reference = [tuple(TextBlob(text).sentiment) for text in texts]
+    textblob_seconds = time.perf_counter() - start
+
+    compiled = np.array(compiled)
+    reference = np.array(reference)
+    difference = np.abs(compiled - reference)
+    mismatched = np.flatnonzero(difference.max(axis=1) > 0.0)
+    return {
+        'texts': len(texts),
+        'exact_share': 1.0 - len(mismatched) / len(texts),
+        'polarity_max_abs_diff': float(difference[:, 0].max()),
+        'polarity_mean_abs_diff': float(difference[:, 0].mean()),
+        'subjectivity_max_abs_diff': float(difference[:, 1].max()),
+        'examples': [{'text': texts[i], 'compiled': compiled[i].tolist(), 'textblob': reference[i].tolist()}
+                     for i in mismatched[:5]],
+        'compiled_startup_ms': compiled_startup * 1000.0,
+        'textblob_startup_ms': textblob_startup * 1000.0,
+        'compiled_us_per_message': compiled_seconds / len(texts) * 1e6,
+        'textblob_us_per_message': textblob_seconds / len(texts) * 1e6
+    }
+
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description="Compile and check the MoodSync sentiment lexicon")
+    commands = parser.add_subparsers(dest='command', required=True)
+
+    build = commands.add_parser('compile', help="compile TextBlob's en-sentiment.xml")
+    build.add_argument('--xml', help="path to en-sentiment.xml (TextBlob's copy by default)")
+    build.add_argument('--output', '-o', default=DEFAULT_LEXICON_PATH)
+
+    parity = commands.add_parser('parity', help="compare the compiled lexicon with TextBlob")
+    parity.add_argument('--lexicon', default=DEFAULT_LEXICON_PATH)
+    parity.add_argument('--input', help="one message per line (a synthetic corpus by default)")
+    parity.add_argument('--messages', type=int, default=5000)
+
+    args = parser.parse_args(argv)
+    if args.command == 'compile':
+        path = compile_lexicon(args.xml, args.output)
+        print(json.dumps({'output': path, 'words': len(SentimentLexicon.load(path)),
+                          'bytes': os.path.getsize(path)}))
+        return 0
+
+    if args.input:
+        with open(args.input, encoding='utf-8') as f:
+            texts = [line.strip() for line in f if line.strip()]
+    else:
+        from benchmark import generate_corpus
+        texts = generate_corpus(args.messages)
+    report = parity_report(texts, args.lexicon)
+    print(json.dumps(report, indent=2, ensure_ascii=False))
+    return 0 if report['exact_share'] == 1.0 else 1
+
+
+if __name__ == '__main__':
+    sys.exit(main())
@@ -0,0 +1,139 @@
+import threading
+import time
+from collections import OrderedDict, namedtuple
+
+import numpy as np
+
+from mood_cascade import CascadeAnalyzer
+from moodanalyser import MoodAnalyzer
+
+# Result of one tracked message
+MoodUpdate = namedtuple('MoodUpdate', [
+    'mood',              # dominant session mood after this message
+    'confidence',        # share of the decayed distribution held by that mood
+    'changed',           # True when the dominant mood switched on this message
+    'previous_mood',     # dominant mood before this message (None for a new session)
+    'message_mood',      # mood of this message alone
+    'distribution'       # {label: share} of the session distribution
+])
+
+
+class SessionMoodTracker:
+    """
+    Running mood per chat session.
+    Each new message is analyzed once and folded into an exponentially decayed
+    distribution over the mood labels; older messages fade with a configurable
+    half-life. State is one fixed-size float32 row per session in a preallocated
+    array, and the least recently active session is evicted when it is full.
+    Callers refetch recommendations only when an update reports changed=True.
+    """
+
+    def __init__(self, analyzer=None, recommender=None, half_life=300.0, max_sessions=10000,
+                 switch_margin=0.1, transformer_temperature=0.05, clock=time.monotonic):
+        """
+        analyzer: MoodAnalyzer for the lexicon tier
+        recommender: optional AIRecommender; ambiguous messages escalate to it via CascadeAnalyzer
+        half_life: seconds after which a message counts half as much
+        switch_margin: share by which a new mood must lead the current one before
+            the dominant mood changes (avoids flapping between close moods)
+        transformer_temperature: softmax temperature for turning transformer
+            mood similarities into a distribution
+        """
+        self.analyzer = analyzer if analyzer is not None else MoodAnalyzer()
+        self.cascade = CascadeAnalyzer(lexicon=self.analyzer, recommender=recommender) if recommender else None
+        self.labels = list(self.analyzer.mood_labels)
+        self.half_life = half_life
+        self.switch_margin = switch_margin
+        self.transformer_temperature = transformer_temperature
+        self.clock = clock
+
+        self._lock = threading.Lock()
+        self._state = np.zeros((max_sessions, len(self.labels)), dtype=np.float32)
+        self._updated_at = np.zeros(max_sessions, dtype=np.float64)
+        self._dominant = np.full(max_sessions, -1, dtype=np.int16)
+        self._slots = OrderedDict()
+        self._free = list(range(max_sessions - 1, -1, -1))
+        self._label_index = {label: i for i, label in enumerate(self.labels)}
+
+    def __len__(self):
+        with self._lock:
+            return len(self._slots)
+
+    def _message_distribution(self, text):
+        """Distribution for one message, from the transformer tier when it answered"""
+        if self.cascade is not None:
+            mood, _, context = self.cascade.analyze_mood(text)
+            scores = context.get('mood_scores')
+            if context.get('tier') == CascadeAnalyzer.TRANSFORMER and scores:
+                distribution = np.zeros(len(self.labels), dtype=np.float32)
+                similarities = np.array(list(scores.values()), dtype=np.float32)
+                weights = np.exp((similarities - similarities.max()) / self.transformer_temperature)
+                for label, weight in zip(scores, weights / weights.sum()):
+                    distribution[self._label_index[label]] = weight
+                return mood, distribution
+
+        mood, _, distribution = self.analyzer.analyze_mood_distribution(text)
+        return mood, distribution
+
+    def _slot(self, session_id):
+        """Row for session_id, allocating (and evicting the idlest session) if needed"""
+        slot = self._slots.get(session_id)
+        if slot is not None:
+            self._slots.move_to_end(session_id)
+            return slot, False
+        if not self._free:
+            _, evicted = self._slots.popitem(last=False)
+            self._free.append(evicted)
+        slot = self._free.pop()
+        self._slots[session_id] = slot
+        self._state[slot] = 0.0
+        self._dominant[slot] = -1
+        return slot, True
+
+    def update(self, session_id, text):
+        """Fold one new message into the session and return a MoodUpdate"""
+        message_mood, distribution = self._message_distribution(text)
+        now = self.clock()
+
+        with self._lock:
+            slot, _ = self._slot(session_id)
+            row = self._state[slot]
+            elapsed = max(0.0, now - self._updated_at[slot])
+            if self._dominant[slot] >= 0 and self.half_life > 0:
+                row *= np.float32(0.5 ** (elapsed / self.half_life))
+            row += distribution
+            self._updated_at[slot] = now
+
+            shares = row / row.sum()
+            previous = int(self._dominant[slot])
+            best = int(np.argmax(shares))
+            # Keep the current mood unless the leader is clearly ahead of it
+            if previous >= 0 and best != previous and shares[best] - shares[previous] < self.switch_margin:
+                best = previous
+            self._dominant[slot] = best
+
+            return MoodUpdate(
+                mood=self.labels[best],
+                confidence=float(shares[best]),
+                changed=best != previous,
+                previous_mood=self.labels[previous] if previous >= 0 else None,
+                message_mood=message_mood,
+                distribution=dict(zip(self.labels, shares.tolist()))
+            )
+
+    def get(self, session_id):
+        """Current (mood, distribution) for a session, or None if it is not tracked"""
+        with self._lock:
+            slot = self._slots.get(session_id)
+            if slot is None or self._dominant[slot] < 0:
+                return None
+            row = self._state[slot]
+            shares = row / row.sum()
+            return (self.labels[self._dominant[slot]], dict(zip(self.labels, shares.tolist())))
+
+    def reset(self, session_id):
+        """Forget a session"""
+        with self._lock:
+            slot = self._slots.pop(session_id, None)
+            if slot is not None:
+                self._free.append(slot)
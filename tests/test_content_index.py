@@ -0,0 +1,30 @@
+import numpy as np
+import pytest
+
+from content_index import ContentIndex
+
+
+def _vector(seed, dim=8):
+    return np.random.default_rng(seed).normal(size=dim)
+
+
+@pytest.mark.parametrize('backend', ['exact', 'ivf'])
+def test_repeated_id_in_one_call_keeps_last_entry(backend):
+    index = ContentIndex(dim=8, backend=backend, train_threshold=4)
+    index.add_many([(f'item-{i}', _vector(i), 'video', None) for i in range(6)])
+
+    index.add_many([
+        ('dup', _vector(100), 'video', {'version': 1}),
+        ('dup', _vector(101), 'music', {'version': 2}),
+    ])
+
+    assert len(index) == 7
+    hits = [hit for hit in index.search(_vector(101), k=10, exact=True) if hit['id'] == 'dup']
+    assert len(hits) == 1
+    assert hits[0]['type'] == 'music'
+    assert hits[0]['metadata'] == {'version': 2}
+
+    assert index.remove('dup')
+    assert len(index) == 6
+    assert 'dup' not in index
+    assert all(hit['id'] != 'dup' for hit in index.search(_vector(101), k=10))
@@ -0,0 +1,204 @@
+import re
+import threading
+
+# Word, emoji/symbol and punctuation pieces; a cheap stand-in for subword tokens
+TOKEN_PATTERN = re.compile(r"\w+|[^\w\s]")
+SENTENCE_PATTERN = re.compile(r"[^.!?\n]+[.!?]*")
+
+# Per-model input budgets in estimated tokens. Subword tokenizers split some
+# words further, so these sit below each model's hard limit (512 for the
+# emotion, sentiment and keyword models, 256 for all-MiniLM-L6-v2)
+MODEL_TOKEN_BUDGETS = {
+    'emotion': 384,
+    'sentiment': 384,
+    'embedding': 192,
+    'keywords': 384
+}
+
+TRUNCATION_STRATEGIES = ('head', 'head_tail', 'salience')
+
+# Words that mark a sentence as being about how the writer feels
+SALIENT_WORDS = frozenset([
+    'i', "i'm", 'im', 'me', 'my', 'feel', 'feeling', 'feels', 'felt', 'mood', 'am',
+    'so', 'very', 'really', 'love', 'hate', 'want', 'need', 'today', 'now', 'tonight'
+])
+
+
+def estimate_tokens(text):
+    """Approximate token count of text"""
+    return len(TOKEN_PATTERN.findall(text))
+
+
+def truncate_head(text, budget):
+    """Keep the first budget tokens"""
+    spans = [match.span() for match in TOKEN_PATTERN.finditer(text)]
+    if len(spans) <= budget:
+        return text
+    return text[:spans[budget - 1][1]] if budget > 0 else ''
+
+
+def truncate_head_tail(text, budget, head_ratio=0.5):
+    """Keep the first and last tokens of text, dropping the middle"""
+    spans = [match.span() for match in TOKEN_PATTERN.finditer(text)]
+    if len(spans) <= budget:
+        return text
+    head = int(budget * head_ratio)
+    tail = budget - head
+    parts = []
+    if head:
+        parts.append(text[:spans[head - 1][1]].rstrip())
+    if tail:
+        parts.append(text[spans[-tail][0]:].lstrip())
+    return ' ... '.join(parts)
+
+
+def salience(sentence, salient_words=SALIENT_WORDS):
+    """Score a sentence by feeling cues per token, plus emphasis and non-ASCII (emoji)"""
+    tokens = TOKEN_PATTERN.findall(sentence.lower())
+    if not tokens:
+        return 0.0
+    cues = sum(token in salient_words for token in tokens)
+    emphasis = sum(token in '!?' or not token.isascii() for token in tokens)
+    return (cues + emphasis) / len(tokens) ** 0.5
+
+
+def truncate_salience(text, budget, salient_words=SALIENT_WORDS):
+    """
+    Keep the most feeling-laden sentences that fit in budget, in their
+    original order. Later sentences win ties, since chat messages tend to
+    end with how the writer feels. Falls back to head+tail when even the
+    best sentence does not fit.
+    """
+    if estimate_tokens(text) <= budget:
+        return text
+    sentences = [match.group().strip() for match in SENTENCE_PATTERN.finditer(text)]
+    sentences = [sentence for sentence in sentences if sentence]
+    ranked = sorted(range(len(sentences)),
+                    key=lambda i: (salience(sentences[i], salient_words), i), reverse=True)
+
+    chosen, used = [], 0
+    for i in ranked:
+        cost = estimate_tokens(sentences[i])
+        if used + cost <= budget:
+            chosen.append(i)
+            used += cost
+    if not chosen:
+        return truncate_head_tail(text, budget)
+    return ' '.join(sentences[i] for i in sorted(chosen))
+
+
+def padding_tokens(lengths, batch_size):
+    """Pad tokens needed to run lengths in consecutive batches of batch_size"""
+    padding = 0
+    for start in range(0, len(lengths), batch_size):
+        batch = lengths[start:start + batch_size]
+        padding += max(batch) * len(batch) - sum(batch)
+    return padding
+
+
+class TextBudget:
+    """
+    Input policy for transformer models.
+    Texts over a model's token budget are shortened with the configured
+    strategy instead of being cut off blindly by the tokenizer, and batches
+    are formed from texts of similar length so little time goes to padding.
+    Counts tokens kept, texts truncated and padding saved per model.
+    """
+
+    def __init__(self, budgets=None, strategy='head_tail', batch_size=16, head_ratio=0.5,
+                 count_tokens=estimate_tokens):
+        """
+        budgets: {model name: max tokens}, merged over MODEL_TOKEN_BUDGETS;
+            a budget of None leaves that model's inputs untouched
+        strategy: 'head', 'head_tail' or 'salience'
+        batch_size: texts per model call when running a bucketed batch
+        count_tokens: token counter, e.g. len(tokenizer.tokenize(text)) for exact counts
+        """
+        if strategy not in TRUNCATION_STRATEGIES:
+            raise ValueError(f"Unknown truncation strategy '{strategy}', expected one of {TRUNCATION_STRATEGIES}")
+        if batch_size < 1:
+            raise ValueError("batch_size must be >= 1")
+        self.budgets = dict(MODEL_TOKEN_BUDGETS)
+        self.budgets.update(budgets or {})
+        self.strategy = strategy
+        self.batch_size = batch_size
+        self.head_ratio = head_ratio
+        self.count_tokens = count_tokens
+        self._lock = threading.Lock()
+        self._stats = {}
+
+    def _count(self, model, **amounts):
+        with self._lock:
+            stats = self._stats.setdefault(model, {
+                'texts': 0, 'truncated': 0, 'tokens_in': 0, 'tokens_kept': 0,
+                'batches': 0, 'padding_tokens': 0, 'padding_tokens_unsorted': 0
+            })
+            for name, amount in amounts.items():
+                stats[name] += amount
+
+    def _shorten(self, text, budget):
+        if self.strategy == 'head':
+            return truncate_head(text, budget)
+        if self.strategy == 'salience':
+            return truncate_salience(text, budget)
+        return truncate_head_tail(text, budget, self.head_ratio)
+
+    def _fit(self, text, model):
+        """(text within the model's budget, tokens before, tokens after)"""
+        tokens = self.count_tokens(text)
+        budget = self.budgets.get(model)
+        if budget is None or tokens <= budget:
+            return text, tokens, tokens
+        shortened = self._shorten(text, budget)
+        return shortened, tokens, self.count_tokens(shortened)
+
+    def prepare(self, text, model):
+        """Fit one text to the model's budget"""
+        shortened, tokens, kept = self._fit(text, model)
+        self._count(model, texts=1, truncated=int(kept < tokens), tokens_in=tokens, tokens_kept=kept)
+        return shortened
+
+    def plan(self, texts, model):
+        """
+        Fit texts to the model's budget and group them by length.
+        Returns a list of (positions, texts) batches covering every input.
+        """
+        fitted = [self._fit(text, model) for text in texts]
+        lengths = [kept for _, _, kept in fitted]
+        order = sorted(range(len(texts)), key=lengths.__getitem__)
+        batches = [order[start:start + self.batch_size] for start in range(0, len(order), self.batch_size)]
+
+        self._count(
+            model,
+            texts=len(texts),
+            truncated=sum(kept < tokens for _, tokens, kept in fitted),
+            tokens_in=sum(tokens for _, tokens, _ in fitted),
+            tokens_kept=sum(lengths),
+            batches=len(batches),
+            padding_tokens=padding_tokens([lengths[i] for i in order], self.batch_size),
+            padding_tokens_unsorted=padding_tokens(lengths, self.batch_size)
+        )
+        return [(positions, [fitted[i][0] for i in positions]) for positions in batches]
+
+    def run(self, model, texts, batch_fn):
+        """
+        Call batch_fn on length-bucketed, budgeted batches of texts and return
+        its per-text results in input order.
+        """
+        texts = list(texts)
+        results = [None] * len(texts)
+        for positions, batch in self.plan(texts, model):
+            for position, result in zip(positions, batch_fn(batch)):
+                results[position] = result
+        return results
+
+    def stats(self):
+        """Per-model counters, including pad tokens saved by length bucketing"""
+        with self._lock:
+            report = {model: dict(stats) for model, stats in self._stats.items()}
+        for stats in report.values():
+            saved = stats['padding_tokens_unsorted'] - stats['padding_tokens']
+            stats['padding_saved'] = saved
+            stats['padding_saved_ratio'] = (saved / stats['padding_tokens_unsorted']
+                                            if stats['padding_tokens_unsorted'] else 0.0)
+        return report